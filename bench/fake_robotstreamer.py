@@ -0,0 +1,227 @@
+"""
+Offline stand-in for robotstreamer.com, for local testing and benchmarks.
+
+One aiohttp server provides:
+- the REST endpoints the connector calls (get_service/rscontrol,
+  get_endpoint/..., set_camera_status)
+- the control WebSocket at /echo, which answers RS_PING with RS_PONG, emits
+  button commands at a configurable rate and records what robots send
+- a jsmpeg MPEG-TS ingest sink at /<stream_key>/<width>/<height>/
+
+Run it on its own with `python -m bench.fake_robotstreamer`, then point the
+connector at it with API_URL=http://127.0.0.1:18000.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import collections
+from aiohttp import web, WSMsgType
+
+
+class IngestStream:
+    """Bytes received on one ingest POST."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connected_at = time.time()
+        self.first_byte_at = None
+        self.last_byte_at = None
+        self.bytes = 0
+        self.open = True
+
+
+class FakeRobotstreamer:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=18000,
+        command_rate=0,
+        pong_delay=0,
+    ):
+        self.host = host
+        self.port = port
+        self.command_rate = command_rate  # Button commands per second, per connection
+        self.pong_delay = pong_delay  # Seconds before answering RS_PING
+
+        self.controls = set()  # Open control WebSocket connections
+        self.handshakes = []  # (time, handshake) for every control connection
+        self.received = []  # (time, message) for everything else robots sent, bar RS_PING
+        self.heartbeats = collections.Counter()  # camera_id -> set_camera_status calls
+        self.ingest = []  # IngestStream for every POST, oldest first
+        self.ingest_tasks = set()
+        self.commands_sent = 0
+
+        self.runner = None
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/v1/get_service/rscontrol", self.get_service),
+                web.get("/v1/get_endpoint/rscontrol_robot/{robot_id}", self.get_control),
+                web.get("/v1/get_endpoint/{kind}/{camera_id}", self.get_ingest),
+                web.post("/v1/set_camera_status", self.set_camera_status),
+                web.get("/echo", self.control),
+                web.post("/{key}/{width}/{height}/", self.ingest_sink),
+            ]
+        )
+
+    # ================================
+    # REST
+    # ================================
+    def endpoint(self):
+        return {"host": self.host, "port": self.port}
+
+    async def get_service(self, request):
+        # No wss service here, the connector falls back to the plain ws endpoint
+        return web.json_response(None)
+
+    async def get_control(self, request):
+        return web.json_response(self.endpoint())
+
+    async def get_ingest(self, request):
+        if request.match_info["kind"] not in ("jsmpeg_video_capture", "jsmpeg_audio_capture"):
+            raise web.HTTPNotFound()
+        return web.json_response(self.endpoint())
+
+    async def set_camera_status(self, request):
+        body = await request.json()
+        self.heartbeats[body.get("camera_id")] += 1
+        return web.json_response({"status": "ok"})
+
+    # ================================
+    # Control WebSocket
+    # ================================
+    async def control(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.controls.add(ws)
+        emitter = None
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data.get("command") == "RS_PING":
+                    if self.pong_delay:
+                        await asyncio.sleep(self.pong_delay)
+                    await ws.send_str(json.dumps({"command": "RS_PONG"}))
+                elif emitter is None:
+                    # First message is the robot's handshake
+                    self.handshakes.append((time.time(), data))
+                    emitter = asyncio.create_task(self.emit_commands(ws))
+                else:
+                    self.received.append((time.time(), data))
+        finally:
+            if emitter:
+                emitter.cancel()
+            self.controls.discard(ws)
+        return ws
+
+    async def emit_commands(self, ws):
+        seq = 0
+        start = time.monotonic()
+        while not ws.closed:
+            if not self.command_rate:
+                await asyncio.sleep(0.1)
+                start, seq = time.monotonic(), 0
+                continue
+            seq += 1
+            # Hold the long-run rate without bursting after a stall
+            delay = start + seq / self.command_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            command = {
+                "user": "bench",
+                "command": "F",
+                "key_position": "down",
+                "rs_bench": {"seq": self.commands_sent, "sent_at": time.time()},
+            }
+            try:
+                await ws.send_str(json.dumps(command))
+            except ConnectionError:
+                return
+            self.commands_sent += 1
+
+    async def drop_control(self):
+        """Close every control connection, as if robotstreamer restarted."""
+        for ws in list(self.controls):
+            await ws.close()
+
+    # ================================
+    # Ingest sink
+    # ================================
+    async def ingest_sink(self, request):
+        stream = IngestStream(request.path)
+        self.ingest.append(stream)
+        self.ingest_tasks.add(asyncio.current_task())
+        try:
+            async for chunk in request.content.iter_any():
+                now = time.time()
+                if stream.first_byte_at is None:
+                    stream.first_byte_at = now
+                stream.last_byte_at = now
+                stream.bytes += len(chunk)
+        except ConnectionResetError:
+            pass  # The connector hung up, e.g. ffmpeg restarting
+        finally:
+            stream.open = False
+            self.ingest_tasks.discard(asyncio.current_task())
+        return web.Response()
+
+    async def drop_ingest(self):
+        """Cut every open ingest connection, as if the ingest server restarted."""
+        for task in list(self.ingest_tasks):
+            task.cancel()
+
+    def ingest_bytes(self, prefix=""):
+        return sum(s.bytes for s in self.ingest if s.path.startswith(prefix))
+
+    # ================================
+    # Lifecycle
+    # ================================
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self):
+        for ws in list(self.controls):
+            await ws.close()
+        if self.runner:
+            await self.runner.cleanup()
+
+    def stats(self):
+        return {
+            "control_connections": len(self.handshakes),
+            "commands_sent": self.commands_sent,
+            "messages_received": len(self.received),
+            "heartbeats": dict(self.heartbeats),
+            "ingest": [
+                {"path": s.path, "bytes": s.bytes, "open": s.open} for s in self.ingest
+            ],
+        }
+
+
+async def serve(args):
+    fake = FakeRobotstreamer(args.host, args.port, args.command_rate, args.pong_delay)
+    await fake.start()
+    print(f"Fake robotstreamer on http://{args.host}:{args.port}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps(fake.stats()))
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--command-rate", type=float, default=1, help="commands/s per robot")
+    parser.add_argument("--pong-delay", type=float, default=0, help="seconds before RS_PONG")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
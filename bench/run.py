@@ -0,0 +1,354 @@
+"""
+End-to-end benchmark of the connector against the fake robotstreamer.
+
+Launches `python -m rs_connector.main` as a subprocess pointed at a
+FakeRobotstreamer, then measures:
+- startup: time to the control handshake and to the first video bytes at the ingest
+- relay: delivery rate and latency against relay client count and slow-client mix
+- recovery: time to reconnect after the control WebSocket or ingest is dropped
+- resources: connector and ffmpeg CPU and RSS while streaming
+
+Results are written as JSON (stdout by default) so runs can be diffed and
+compared against a baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import websockets
+from urllib.parse import urlencode, parse_qsl
+from .fake_robotstreamer import FakeRobotstreamer
+
+RELAY_URL = "ws://127.0.0.1:8765/"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def at(p):
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+    return {
+        "p50_ms": at(0.5),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+async def wait_for(predicate, timeout, interval=0.01):
+    """Poll predicate until it's true. Returns the seconds it took, or None on timeout."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if predicate():
+            return time.monotonic() - start
+        await asyncio.sleep(interval)
+    return None
+
+
+# ================================
+# Process accounting from /proc
+# ================================
+def proc_stat(pid):
+    """(cpu seconds, rss bytes, parent pid) for a process, or None if it's gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return cpu, int(fields[21]) * PAGE_SIZE, int(fields[1])
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            stat = proc_stat(int(entry))
+            if stat and stat[2] == pid:
+                found.append(int(entry))
+    return found
+
+
+async def measure_resources(pid, seconds):
+    """CPU percent and peak RSS of the connector and its children over a window."""
+
+    def snapshot():
+        pids = {"connector": [pid], "children": children(pid)}
+        return {
+            group: [s for s in (proc_stat(p) for p in members) if s]
+            for group, members in pids.items()
+        }
+
+    before = snapshot()
+    start = time.monotonic()
+    peak = {"connector": 0, "children": 0}
+    while time.monotonic() - start < seconds:
+        await asyncio.sleep(0.5)
+        for group, stats in snapshot().items():
+            peak[group] = max(peak[group], sum(s[1] for s in stats))
+    after = snapshot()
+    elapsed = time.monotonic() - start
+
+    result = {}
+    for group in ("connector", "children"):
+        cpu = sum(s[0] for s in after[group]) - sum(s[0] for s in before[group])
+        result[group] = {
+            "cpu_percent": round(100 * cpu / elapsed, 2),
+            "peak_rss_mb": round(peak[group] / 2**20, 2),
+        }
+    return result
+
+
+# ================================
+# Relay clients
+# ================================
+def decode(frame):
+    """Messages in a relay frame, in any of the formats a client can negotiate."""
+    if isinstance(frame, bytes):
+        import msgpack
+
+        data = msgpack.unpackb(frame)
+    else:
+        data = json.loads(frame)
+    return data if isinstance(data, list) else [data]
+
+
+async def relay_client(url, latencies, counts, index, slow_delay, ready):
+    async with websockets.connect(url, max_queue=None) as ws:
+        await ws.recv()  # Greeting
+        ready.set()
+        async for frame in ws:
+            received = time.time()
+            for data in decode(frame):
+                sent_at = data.get("rs_bench", {}).get("sent_at")
+                if sent_at is None:
+                    continue
+                latencies.append(received - sent_at)
+                counts[index] += 1
+            if slow_delay:
+                await asyncio.sleep(slow_delay)
+
+
+async def bench_relay(fake, clients, slow_fraction, rate, duration, slow_delay, params):
+    slow = int(round(clients * slow_fraction))
+    url = RELAY_URL + (f"?{urlencode(params)}" if params else "")
+    fast_latencies, slow_latencies = [], []
+    counts = [0] * clients
+    ready = [asyncio.Event() for _ in range(clients)]
+    tasks = [
+        asyncio.create_task(
+            relay_client(
+                url,
+                slow_latencies if i < slow else fast_latencies,
+                counts,
+                i,
+                slow_delay if i < slow else 0,
+                ready[i],
+            )
+        )
+        for i in range(clients)
+    ]
+    await asyncio.wait_for(asyncio.gather(*(e.wait() for e in ready)), 10)
+
+    sent_before = fake.commands_sent
+    fake.command_rate = rate
+    await asyncio.sleep(duration)
+    fake.command_rate = 0
+    # Let queues drain before counting
+    await asyncio.sleep(1)
+    sent = fake.commands_sent - sent_before
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    fast_counts, slow_counts = counts[slow:], counts[:slow]
+    return {
+        "clients": clients,
+        "slow_clients": slow,
+        "params": params,
+        "rate": rate,
+        "sent": sent,
+        "delivered_per_sec": round(sum(counts) / duration, 1),
+        "fast_delivery_ratio": round(sum(fast_counts) / (sent * len(fast_counts)), 4)
+        if sent and fast_counts
+        else None,
+        "slow_delivery_ratio": round(sum(slow_counts) / (sent * len(slow_counts)), 4)
+        if sent and slow_counts
+        else None,
+        "fast_latency": percentiles(fast_latencies),
+        "slow_latency": percentiles(slow_latencies),
+    }
+
+
+# ================================
+# Scenarios
+# ================================
+def connector_env(args):
+    env = dict(os.environ)
+    env.update(
+        API_URL=f"http://127.0.0.1:{args.port}",
+        ROBOT_ID="bench",
+        CAMERA_ID="bench-cam",
+        STREAM_KEY="bench-key",
+        VIDEO_DEVICE=args.video_device,
+        VIDEO_XRES=str(args.xres),
+        VIDEO_YRES=str(args.yres),
+        STATIC_LOOP="1" if args.static_loop else "0",
+        DISCOVERY_CACHE="",
+        LOG_LEVEL=args.log_level,
+    )
+    env.pop("RS_CONFIG", None)
+    return env
+
+
+async def run(args):
+    fake = FakeRobotstreamer(port=args.port)
+    await fake.start()
+    results = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "video_device": args.video_device,
+            "static_loop": args.static_loop,
+            "size": f"{args.xres}x{args.yres}",
+        }
+    }
+    video_path = f"/bench-key/{args.xres}/{args.yres}/"
+
+    def video_streams():
+        return [s for s in fake.ingest if s.path == video_path and s.bytes]
+
+    log = open(args.log, "w") if args.log else subprocess.DEVNULL
+    launched = time.monotonic()
+    launched_wall = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "rs_connector.main"],
+        env=connector_env(args),
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        # Startup
+        handshake = await wait_for(lambda: fake.handshakes, 30)
+        first_frame = await wait_for(video_streams, 60)
+        results["startup"] = {
+            "control_handshake_s": round(handshake, 3) if handshake is not None else None,
+            "first_video_byte_s": round(video_streams()[0].first_byte_at - launched_wall, 3)
+            if first_frame is not None
+            else None,
+        }
+        if first_frame is None:
+            raise RuntimeError("Connector never delivered video to the ingest")
+        # Steady state before measuring anything else
+        await asyncio.sleep(2)
+
+        # Resource use while streaming with no control traffic
+        results["resources_idle"] = await measure_resources(proc.pid, args.duration)
+
+        # Relay
+        results["relay"] = []
+        for clients in args.clients:
+            for slow_fraction in args.slow:
+                for params in args.relay_params:
+                    results["relay"].append(
+                        await bench_relay(
+                            fake,
+                            clients,
+                            slow_fraction,
+                            args.rate,
+                            args.duration,
+                            args.slow_delay,
+                            params,
+                        )
+                    )
+
+        # Resource use under control traffic
+        fake.command_rate = args.rate
+        results["resources_busy"] = await measure_resources(proc.pid, args.duration)
+        fake.command_rate = 0
+
+        # Control recovery
+        connections = len(fake.handshakes)
+        await fake.drop_control()
+        reconnected = await wait_for(lambda: len(fake.handshakes) > connections, 120)
+        results["control_recovery_s"] = (
+            round(reconnected, 3) if reconnected is not None else None
+        )
+
+        # Ingest recovery
+        streams = len(video_streams())
+        await fake.drop_ingest()
+        recovered = await wait_for(lambda: len(video_streams()) > streams, 120)
+        results["ingest_recovery_s"] = round(recovered, 3) if recovered is not None else None
+    finally:
+        proc.terminate()
+        stopped = time.monotonic()
+        # Keep the loop running meanwhile, the fake has to answer the connector's closing handshakes
+        if await wait_for(lambda: proc.poll() is not None, 10) is None:
+            proc.kill()
+            proc.wait()
+        results["shutdown_s"] = round(time.monotonic() - stopped, 3)
+        results["wall_s"] = round(time.monotonic() - launched, 3)
+        results["fake"] = {
+            "control_connections": len(fake.handshakes),
+            "commands_sent": fake.commands_sent,
+            "heartbeats": sum(fake.heartbeats.values()),
+            "ingest_bytes": fake.ingest_bytes(),
+        }
+        await fake.stop()
+        if log is not subprocess.DEVNULL:
+            log.close()
+    return results
+
+
+def csv(cast):
+    return lambda value: [cast(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=18000, help="fake robotstreamer port")
+    parser.add_argument("--video-device", default="rs_connector/test_pattern.jpg")
+    parser.add_argument("--no-static-loop", dest="static_loop", action="store_false")
+    parser.add_argument("--xres", type=int, default=320)
+    parser.add_argument("--yres", type=int, default=240)
+    parser.add_argument("--clients", type=csv(int), default=[1, 10, 50])
+    parser.add_argument("--slow", type=csv(float), default=[0, 0.2], help="slow client fractions")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds per message")
+    parser.add_argument(
+        "--relay-params",
+        type=lambda value: [dict(parse_qsl(p)) for p in value.split(";")],
+        default=[{}],
+        help='relay query strings to compare, e.g. ";batch=20;format=msgpack&batch=20"',
+    )
+    parser.add_argument("--rate", type=float, default=50, help="upstream commands/s")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per measurement")
+    parser.add_argument("--log", help="write the connector's log here")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
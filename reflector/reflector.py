@@ -2,28 +2,62 @@ import asyncio
 import websockets
 import json
 from PIL import Image, ImageDraw, ImageFont
+from functools import lru_cache
 import os
+import stat
+import sys
+import threading
+import time
 
 # Config
 RS_CONNECTOR_WS = os.environ.get("RS_CONNECTOR_WS", "ws://172.17.0.3:8765")
-OUTPUT_IMAGE = os.environ.get("REFLECTOR_IMAGE", "reflector_output.jpg")
+# Raw RGB24 frames are written here for the connector's ffmpeg to read
+# (a FIFO shared with rs_connector's VIDEO_DEVICE, or "-" for stdout)
+OUTPUT_PIPE = os.environ.get("REFLECTOR_PIPE", "/tmp/reflector.rgb")
+# Optional JPEG snapshot of the latest frame, for debugging
+OUTPUT_IMAGE = os.environ.get("REFLECTOR_IMAGE")
 FONT_PATH = os.environ.get(
     "REFLECTOR_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
 )
-IMG_SIZE = (640, 480)
+# Defaults follow the connector's own settings, so a shared environment needs no extra keys
+IMG_SIZE = tuple(
+    int(v)
+    for v in os.environ.get(
+        "REFLECTOR_SIZE",
+        f"{os.environ.get('VIDEO_XRES', 768)}x{os.environ.get('VIDEO_YRES', 432)}",
+    ).split("x")
+)
+FPS = int(os.environ.get("REFLECTOR_FPS", os.environ.get("VIDEO_FRAMERATE", 25)))
 BG_COLOR = (30, 30, 30)
 TEXT_COLOR = (255, 255, 255)
 
 last_button = "None"
+# Bumped on every command; the frame writer renders at most once per output frame
+# no matter how many commands arrived in between (latest wins)
+version = 0
 
 
-def update_image(text):
-    img = Image.new("RGB", IMG_SIZE, BG_COLOR)
-    draw = ImageDraw.Draw(img)
+@lru_cache(maxsize=1)
+def load_font():
     try:
-        font = ImageFont.truetype(FONT_PATH, 48)
+        return ImageFont.truetype(FONT_PATH, 48)
     except Exception:
-        font = ImageFont.load_default()
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=1)
+def background():
+    return Image.new("RGB", IMG_SIZE, BG_COLOR)
+
+
+# Each cached frame is a full raw frame (~1 MB at 768x432) and the text comes from chat,
+# so only the last few are kept, enough for buttons being pressed back and forth
+@lru_cache(maxsize=4)
+def render_frame(text):
+    """Render text to a raw RGB24 frame. Recently shown button texts come from the cache."""
+    img = background().copy()
+    draw = ImageDraw.Draw(img)
+    font = load_font()
     bbox = draw.textbbox((0, 0), text, font=font)
     w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
     draw.text(
@@ -32,23 +66,104 @@ def update_image(text):
         fill=TEXT_COLOR,
         font=font,
     )
-    img.save(OUTPUT_IMAGE)
-    print(f"Updated image with: {text}")
+    return img.tobytes()
+
+
+def open_output():
+    if OUTPUT_PIPE == "-":
+        return sys.stdout.buffer
+    if not os.path.exists(OUTPUT_PIPE):
+        os.mkfifo(OUTPUT_PIPE)
+    elif not stat.S_ISFIFO(os.stat(OUTPUT_PIPE).st_mode):
+        raise RuntimeError(f"{OUTPUT_PIPE} exists and is not a FIFO")
+    print(f"Waiting for a reader on {OUTPUT_PIPE}...", file=sys.stderr)
+    # Blocks until ffmpeg opens the other end
+    return open(OUTPUT_PIPE, "wb", buffering=0)
+
+
+def write_frames():
+    """
+    Write the current frame to the pipe at a steady FPS forever.
+    rawvideo input timestamps frames by count, so frames must keep flowing
+    even when nothing changes.
+    """
+    while True:
+        try:
+            out = open_output()
+        except Exception as e:
+            print(f"Error opening {OUTPUT_PIPE}: {e}", file=sys.stderr)
+            time.sleep(1)
+            continue
+        print(f"Streaming {IMG_SIZE[0]}x{IMG_SIZE[1]} frames at {FPS}fps", file=sys.stderr)
+        rendered = None
+        frame = None
+        start = time.monotonic()
+        n = 0
+        try:
+            while True:
+                if rendered != version:
+                    rendered = version
+                    frame = render_frame(last_button)
+                    if OUTPUT_IMAGE:
+                        Image.frombytes("RGB", IMG_SIZE, frame).save(OUTPUT_IMAGE)
+                out.write(frame)
+                n += 1
+                delay = start + n / FPS - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        except (BrokenPipeError, OSError) as e:
+            # The reader went away (ffmpeg restarting), wait for the next one
+            print(f"Pipe closed: {e}", file=sys.stderr)
+            if out is not sys.stdout.buffer:
+                out.close()
+            time.sleep(0.5)
+
+
+def show_button(data):
+    global last_button, version
+    if "user" in data and "command" in data:
+        last_button = f"{data['user']}: {data['command']} ({data.get('key_position','')})"
+        version += 1
 
 
 async def listen_buttons():
-    global last_button
-    async with websockets.connect(RS_CONNECTOR_WS) as ws:
-        print(f"Connected to {RS_CONNECTOR_WS}")
-        async for message in ws:
-            try:
-                data = json.loads(message)
-                if "user" in data and "command" in data:
-                    last_button = f"{data['user']}: {data['command']} ({data.get('key_position','')})"
-                    update_image(last_button)
-            except Exception as e:
-                print(f"Error: {e}")
+    # Last relay sequence number seen, so a reconnect resumes instead of starting blank
+    epoch, seq = None, None
+    while True:
+        # Only button presses are relayed to us, so pings and pongs never reach the reflector
+        url = RS_CONNECTOR_WS
+        if "user=" not in url:
+            url += f"{'&' if '?' in url else '?'}user=*&command=*"
+        if seq is not None:
+            url += f"{'&' if '?' in url else '?'}since={seq}&epoch={epoch}"
+        elif "snapshot=" not in url:
+            url += f"{'&' if '?' in url else '?'}snapshot=1"
+        try:
+            async with websockets.connect(url) as ws:
+                print(f"Connected to {url}", file=sys.stderr)
+                async for message in ws:
+                    try:
+                        data = json.loads(message)
+                        relay = data.get("rs_relay")
+                        if relay is not None:
+                            epoch = relay.get("epoch", epoch)
+                            if "snapshot" in relay:
+                                # Show the most recent press, live traffic continues from here
+                                for state in relay["snapshot"][-1:]:
+                                    show_button(state)
+                                seq = relay["seq"]
+                            elif seq is None:
+                                seq = relay.get("seq")
+                            continue
+                        seq = data.get("rs_seq", seq)
+                        show_button(data)
+                    except Exception as e:
+                        print(f"Error: {e}", file=sys.stderr)
+        except (OSError, websockets.ConnectionClosed) as e:
+            print(f"Relay connection lost: {e}", file=sys.stderr)
+        await asyncio.sleep(1)
 
 
 if __name__ == "__main__":
+    threading.Thread(target=write_frames, daemon=True).start()
     asyncio.run(listen_buttons())
@@ -1,9 +1,10 @@
+import os
 import asyncio
 import websockets
 
 
 async def test():
-    uri = "ws://172.17.0.3:8765"
+    uri = os.environ.get("RS_CONNECTOR_WS", "ws://172.17.0.3:8765")
     async with websockets.connect(uri) as ws:
         print("Connected!")
         try:
@@ -0,0 +1,184 @@
+import time
+import logging
+import asyncio
+from .metrics import REGISTRY
+
+ABR_RUNG = REGISTRY.gauge(
+    "rs_abr_rung",
+    "Current rung of the adaptive encode ladder (0 is the top)",
+    ("robot",),
+)
+ABR_KBPS = REGISTRY.gauge(
+    "rs_abr_kbps",
+    "Video bitrate currently selected by the adaptive controller",
+    ("robot",),
+)
+ABR_CHANGES = REGISTRY.counter(
+    "rs_abr_changes_total",
+    "Encode ladder changes made by the adaptive controller",
+    ("robot", "direction"),
+)
+
+
+def build_ladder(xres, yres, kbps, min_kbps, min_scale=0.5, steps=4):
+    """
+    Build an encode ladder from the configured settings down to the floor.
+    Returns a list of (width, height, kbps) rungs, best first. Bitrate falls
+    geometrically, and resolution follows it down to `min_scale` of the capture size.
+    """
+    min_kbps = min(min_kbps, kbps)
+    ladder = []
+    for i in range(steps):
+        t = i / (steps - 1) if steps > 1 else 0
+        rung_kbps = int(round(kbps * (min_kbps / kbps) ** t))
+        scale = min_scale**t
+        # mpeg1video wants dimensions that are multiples of 16
+        width = max(16, int(xres * scale) // 16 * 16)
+        height = max(16, int(yres * scale) // 16 * 16)
+        rung = (width, height, rung_kbps)
+        if not ladder or ladder[-1] != rung:
+            ladder.append(rung)
+    return ladder
+
+
+class BitrateController:
+    """
+    Adaptive bitrate/resolution controller for the jsmpeg stream.
+
+    Every `interval` seconds it measures the encoder's real-time speed and output
+    throughput over the last window from the live ffmpeg progress stats. ffmpeg's
+    HTTP output blocks when the ingest pushes back, so a slow ingest shows up as
+    lost speed just like a slow encoder. Sustained trouble steps the ladder down.
+    A long healthy stretch steps it back up. Hysteresis comes from asymmetric
+    sample counts, a minimum dwell per rung and a growing hold before retrying
+    a rung that already failed.
+    """
+
+    def __init__(
+        self,
+        streamer,
+        ladder,
+        interval=2,
+        speed_threshold=0.95,
+        down_after=3,
+        up_after=30,
+        min_dwell=20,
+        warmup=6,
+        label="jsmpeg-video",
+    ):
+        self.streamer = streamer
+        self.ladder = ladder
+        self.interval = interval
+        self.speed_threshold = speed_threshold
+        self.down_after = down_after
+        self.up_after = up_after
+        self.min_dwell = min_dwell
+        self.warmup = warmup
+        self.label = label
+
+        self.rung = 0
+        self.changed_at = time.monotonic()
+        self.bad_samples = 0
+        self.good_samples = 0
+        self.hold_until = {}  # rung -> monotonic time before which we won't climb back to it
+        self.hold_seconds = {}  # rung -> current hold length, doubled on every failure
+        self.last = None  # (wall time, out_time, total_size, drop_frames) of the previous sample
+        self.last_update = None  # stats.updated_at seen by the previous sample
+        self.throughput_kbps = None
+        self.window_speed = None
+
+        self.task = None
+        self.logger = logging.getLogger("BitrateController")
+
+    def start(self):
+        self.apply_metrics()
+        self.task = asyncio.create_task(self.run())
+        self.logger.info(f"Adaptive bitrate enabled with ladder {self.ladder}")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except Exception as e:
+                self.logger.error(f"Adaptive bitrate sample failed: {e}")
+
+    async def sample(self):
+        stats = self.streamer.stats.get(self.label)
+        if stats is None or stats.updated_at is None:
+            return
+        # A dead or restarting ffmpeg leaves its last stats behind. Frozen counters
+        # would read as zero speed, so skip them and start a fresh window afterwards.
+        if not self.streamer.video_running() or stats.updated_at == self.last_update:
+            self.last = None
+            return
+        self.last_update = stats.updated_at
+        now = time.monotonic()
+        current = (now, stats.out_time, stats.total_size, stats.drop_frames)
+        previous, self.last = self.last, current
+        # Skip the first sample, a fresh ffmpeg (counters went backwards) and the warm-up
+        if (
+            previous is None
+            or stats.out_time < previous[1]
+            or now - self.changed_at < self.warmup
+        ):
+            return
+
+        elapsed = now - previous[0]
+        self.window_speed = (stats.out_time - previous[1]) / elapsed
+        self.throughput_kbps = (stats.total_size - previous[2]) * 8 / 1000 / elapsed
+        dropped = stats.drop_frames - previous[3]
+
+        healthy = self.window_speed >= self.speed_threshold and dropped == 0
+        if healthy:
+            self.good_samples += 1
+            self.bad_samples = 0
+        else:
+            self.bad_samples += 1
+            self.good_samples = 0
+            self.logger.debug(
+                f"Behind real time: speed {self.window_speed:.2f}, "
+                f"{self.throughput_kbps:.0f} kbit/s, {dropped} dropped"
+            )
+
+        dwelled = now - self.changed_at >= self.min_dwell
+        if self.bad_samples >= self.down_after and self.rung < len(self.ladder) - 1:
+            # The rung we're leaving failed, back off before trying it again
+            hold = self.hold_seconds.get(self.rung, self.min_dwell * 3) * 2
+            self.hold_seconds[self.rung] = min(hold, 3600)
+            self.hold_until[self.rung] = now + self.hold_seconds[self.rung]
+            await self.change(self.rung + 1, "down")
+        elif (
+            self.good_samples >= self.up_after
+            and dwelled
+            and self.rung > 0
+            and now >= self.hold_until.get(self.rung - 1, 0)
+        ):
+            await self.change(self.rung - 1, "up")
+
+    async def change(self, rung, direction):
+        width, height, kbps = self.ladder[rung]
+        self.logger.warning(
+            f"Stepping encode ladder {direction} to {width}x{height} @ {kbps}k "
+            f"(window speed {self.window_speed:.2f}, {self.throughput_kbps:.0f} kbit/s out)"
+        )
+        self.rung = rung
+        self.changed_at = time.monotonic()
+        self.bad_samples = 0
+        self.good_samples = 0
+        self.last = None
+        ABR_CHANGES.inc(robot=self.streamer.robot_id, direction=direction)
+        self.apply_metrics()
+        await self.streamer.restart_jsmpeg_stream(kbps=kbps, output_size=(width, height))
+
+    def apply_metrics(self):
+        ABR_RUNG.set(self.rung, robot=self.streamer.robot_id)
+        ABR_KBPS.set(self.ladder[self.rung][2], robot=self.streamer.robot_id)
@@ -3,8 +3,68 @@ import logging
 import asyncio
 import websockets
 import json
-import threading
-import requests
+import random
+import aiohttp
+from .relay import RelayServer, DROP_OLDEST
+from .upstream import UpstreamQueue, CONTROL, BULK
+from .discovery import Discovery, DEFAULT_CACHE_PATH
+from .metrics import REGISTRY
+
+UPSTREAM_MESSAGES = REGISTRY.counter(
+    "rs_upstream_messages_total",
+    "Messages received on the upstream control WebSocket",
+    ("robot",),
+)
+PING_RTT = REGISTRY.histogram(
+    "rs_ping_rtt_seconds",
+    "Round-trip time of RS_PING/RS_PONG exchanges",
+    ("robot",),
+    buckets=(0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1, 2, 5),
+)
+CONTROL_CONNECTED = REGISTRY.gauge(
+    "rs_control_connected",
+    "1 while the upstream control WebSocket is connected",
+    ("robot",),
+)
+CONTROL_RECONNECTS = REGISTRY.counter(
+    "rs_control_reconnects_total",
+    "Times the upstream control WebSocket was re-established",
+    ("robot",),
+)
+CONTROL_RECOVERY = REGISTRY.gauge(
+    "rs_control_recovery_seconds",
+    "Time-to-recover of the last upstream control outage",
+    ("robot",),
+)
+REST_LATENCY = REGISTRY.histogram(
+    "rs_rest_request_seconds",
+    "Latency of robotstreamer REST calls, including retries",
+    ("endpoint",),
+)
+REST_ERRORS = REGISTRY.counter(
+    "rs_rest_errors_total",
+    "robotstreamer REST calls that failed or returned an error status",
+    ("endpoint",),
+)
+
+# Connect and read timeouts for robotstreamer REST calls
+HTTP_TIMEOUT = aiohttp.ClientTimeout(sock_connect=3.05, sock_read=10)
+# Connection errors and these statuses are retried with exponential backoff
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Seconds without an RS_PONG before a ping is taken as lost and another is sent
+PING_LOST_AFTER = 15
+
+
+def make_http_session(pool_maxsize=6):
+    """
+    Build a keep-alive session that pools connections to the robotstreamer API
+    and ingests. Must be called with the event loop running. Each static loop
+    holds one connection for as long as it streams.
+    """
+    connector = aiohttp.TCPConnector(limit=pool_maxsize, keepalive_timeout=60)
+    return aiohttp.ClientSession(connector=connector)
 
 
 class APIClient:
@@ -16,6 +76,23 @@ class APIClient:
         api_url=None,
         relay_host="0.0.0.0",
         relay_port=8765,
+        relay_queue_size=100,
+        relay_overflow_policy=DROP_OLDEST,
+        relay_history_size=1000,
+        relay_snapshot_size=1000,
+        relay_compression="small",
+        relay_upstream=False,
+        http_session=None,
+        http_timeout=HTTP_TIMEOUT,
+        discovery_ttl=300,
+        discovery_cache_path=DEFAULT_CACHE_PATH,
+        reconnect_min_delay=1,
+        reconnect_max_delay=60,
+        trace=False,
+        relay=None,
+        upstream_rate=10,
+        upstream_burst=20,
+        upstream_queue_size=100,
     ):
         # Setup variables
         self.robot_id = robot_id
@@ -24,199 +101,354 @@ class APIClient:
         self.api_url = api_url or "https://api.robotstreamer.com"
 
         # Setup logging
-        self.logger = logging.getLogger("APIClient")
+        self.logger = logging.getLogger(f"APIClient[{robot_id}]")
+
+        # Shared pooled HTTP session for every REST call, made in start() if not given
+        self._owns_http = http_session is None
+        self.http = http_session
+        self.http_timeout = http_timeout
 
         # Setup websocket
         self.ws = None
-        self.loop = None
-        self.thread = None
-        self.stop_event = threading.Event()  # For thread shutdown
-        self.async_stop_event = None  # For async shutdown
+        self.ws_task = None
+        self.alive_task = None
+        self.async_stop_event = asyncio.Event()  # For async shutdown
         self.ping_task = None
         self.receive_task = None
 
-        # Relay server
-        self.relay_host = relay_host
-        self.relay_port = relay_port
-        self.relay_server = None
-        self.relay_clients = set()
+        # Reconnect supervisor state
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.disconnected_at = None  # Loop time the last working session dropped
+        self.reconnect_count = 0
+        self.last_recovery_seconds = None  # Time-to-recover of the last outage
+
+        # Control path latency
+        self.last_ping_rtt = None
+        self.trace = trace  # Attach rs_trace timestamps to relayed messages
+
+        # Relay server, shared between robots when one is passed in
+        self._owns_relay = relay is None
+        self.relay = relay or RelayServer(
+            relay_host,
+            relay_port,
+            queue_size=relay_queue_size,
+            overflow_policy=relay_overflow_policy,
+            history_size=relay_history_size,
+            snapshot_size=relay_snapshot_size,
+            compression=relay_compression,
+            accept_upstream=relay_upstream,
+        )
 
-        # Pong event for main thread to wait on
-        self.pong_event = threading.Event()
+        # Everything sent up the control WebSocket after the handshake goes through here
+        self.upstream = UpstreamQueue(
+            robot_id, upstream_rate, upstream_burst, upstream_queue_size
+        )
+
+        # Pong event for the pipeline to wait on
+        self.pong_event = asyncio.Event()
+
+        # Endpoint discovery (cached, concurrent, warm-started from disk)
+        self.discovery = Discovery(
+            {
+                "control": self.get_control_host,
+                "video": self.get_jsmpeg_video_endpoint,
+                "audio": self.get_jsmpeg_audio_endpoint,
+            },
+            cache_id=f"{robot_id}/{camera_id}",
+            ttl=discovery_ttl,
+            cache_path=discovery_cache_path,
+        )
 
-    def get_control_host(self):
-        # Try /v1/get_service/rscontrol first
+    async def http_request(self, method, url, name, **kwargs):
+        """
+        Make a REST call, retrying connection errors and 429/5xx responses.
+        Returns (status, body). name is the endpoint label used for REST metrics.
+        """
+        start = time.monotonic()
+        try:
+            for attempt in range(HTTP_RETRIES + 1):
+                retry_in = HTTP_BACKOFF * 2**attempt
+                try:
+                    async with self.http.request(
+                        method, url, timeout=self.http_timeout, **kwargs
+                    ) as resp:
+                        status, body = resp.status, await resp.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == HTTP_RETRIES:
+                        raise
+                    await asyncio.sleep(retry_in)
+                    continue
+                if status not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                    break
+                await asyncio.sleep(retry_in)
+        except Exception:
+            REST_ERRORS.inc(endpoint=name)
+            raise
+        finally:
+            REST_LATENCY.observe(time.monotonic() - start, endpoint=name)
+        if status >= 400:
+            REST_ERRORS.inc(endpoint=name)
+        return status, body
+
+    async def http_get(self, url, name):
+        """GET a JSON document. Raises RuntimeError for an error status."""
+        status, body = await self.http_request("GET", url, name)
+        if status >= 400:
+            raise RuntimeError(f"{name} returned HTTP {status}")
+        return json.loads(body)
+
+    async def http_post(self, url, data, name):
+        """POST a JSON document, returns the status code."""
+        status, _ = await self.http_request("POST", url, name, json=data)
+        return status
+
+    async def get_control_service(self):
+        # /v1/get_service/rscontrol (preferred)
         try:
             url = f"{self.api_url}/v1/get_service/rscontrol"
-            resp = requests.get(url)
-            data = resp.json()
+            data = await self.http_get(url, "get_service/rscontrol")
             if data:
                 data["protocol"] = "wss"
-                self.logger.info(f"Got control host (service): {data}")
                 return data
         except Exception as e:
             self.logger.warning(f"Failed to get_service/rscontrol: {e}")
-        # Fallback to /v1/get_endpoint/rscontrol_robot/{robot_id}
+        return None
+
+    async def get_control_endpoint(self):
+        # Fallback /v1/get_endpoint/rscontrol_robot/{robot_id}
         try:
             url = f"{self.api_url}/v1/get_endpoint/rscontrol_robot/{self.robot_id}"
-            resp = requests.get(url)
-            data = resp.json()
+            data = await self.http_get(url, "get_endpoint/rscontrol_robot")
             if data:
                 data["protocol"] = "ws"
-                self.logger.info(f"Got control host (endpoint): {data}")
                 return data
         except Exception as e:
             self.logger.error(f"Failed to get_endpoint/rscontrol_robot: {e}")
         return None
 
-    # ================================
-    # Relay server
-    # ================================
-    async def relay_handler(self, websocket):
-        # Register client
-        self.relay_clients.add(websocket)
-        self.logger.info(f"Relay client connected: {websocket.remote_address}")
-        try:
-            await websocket.send(json.dumps({"rs_connector": time.time()}))
-            await websocket.wait_closed()  # Keeps the handler alive until the client disconnects
-        finally:
-            self.relay_clients.remove(websocket)
-            self.logger.info(f"Relay client disconnected: {websocket.remote_address}")
-
-    async def start_relay_server(self):
-        self.relay_server = await websockets.serve(
-            self.relay_handler, self.relay_host, self.relay_port
-        )
-        self.logger.info(
-            f"Relay WebSocket server started on ws://{self.relay_host}:{self.relay_port}"
+    async def get_control_host(self):
+        # Ask for the service and the fallback endpoint at the same time, prefer the service
+        service, endpoint = await asyncio.gather(
+            self.get_control_service(), self.get_control_endpoint()
         )
-
-    async def send_to_relay_clients(self, message):
-        # Forward message to all connected relay clients
-        if self.relay_clients:
-            self.logger.debug(
-                f"Processing {len(self.relay_clients)} clients. Message: {message.rstrip()}"
-            )
-            try:
-                for client in list(self.relay_clients):
-                    try:
-                        await client.send(message)
-                        self.logger.debug(f"Sent to client: {client}")
-                    except Exception as e:
-                        self.logger.error(f"Error sending to client {client}: {e}")
-            except Exception as e:
-                self.logger.error(f"Exception during relay_clients iteration: {e}")
+        if service:
+            self.logger.info(f"Got control host (service): {service}")
+            return service
+        if endpoint:
+            self.logger.info(f"Got control host (endpoint): {endpoint}")
+            return endpoint
+        return None
 
     # ================================
     # Websocket Client System
     # ================================
     async def ws_handler(self):
-        # Async event for clean shutdown
-        self.async_stop_event = asyncio.Event()
-        h = self.get_control_host()
+        """
+        Reconnect supervisor for the control WebSocket.
+        The relay server stays up for the life of the client, and the upstream
+        session is re-established with jittered exponential backoff whenever it drops.
+        """
+        loop = asyncio.get_running_loop()
+        # Start relay server (a shared relay is started by its owner)
+        if self._owns_relay:
+            await self.relay.start()
+
+        delay = self.reconnect_min_delay
+        try:
+            while not self.async_stop_event.is_set():
+                connected = await self.control_session()
+                if self.async_stop_event.is_set():
+                    break
+
+                if connected:
+                    # We had a working session, start the outage clock and retry quickly
+                    self.disconnected_at = loop.time()
+                    delay = self.reconnect_min_delay
+                else:
+                    delay = min(delay * 2, self.reconnect_max_delay)
+
+                # Equal jitter so a fleet of robots doesn't reconnect in lockstep
+                wait = delay / 2 + random.uniform(0, delay / 2)
+                self.logger.warning(
+                    f"Control WebSocket down, reconnecting in {wait:.1f}s..."
+                )
+                try:
+                    await asyncio.wait_for(self.async_stop_event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._owns_relay:
+                await self.relay.stop()
+
+    async def control_session(self):
+        """Run one upstream session. Returns True if the handshake went through."""
+        loop = asyncio.get_running_loop()
+        h = await self.discovery.get("control")
         if not h:
-            self.logger.error(
-                "Could not get control host, aborting WebSocket connection."
-            )
-            return
+            self.logger.error("Could not get control host.")
+            return False
         # Connect to websocket (This URL from controller.py)
         url = f"{h['protocol']}://{h['host']}:{h['port']}/echo"
         self.logger.info(f"Connecting to control WebSocket: {url}")
         try:
-            # Start relay server
-            await self.start_relay_server()
-            async with websockets.connect(url) as websocket:
-                self.ws = websocket
-                # Handshake
-                if h["protocol"] == "wss":
-                    # Construct a RS legal handshake
-                    handshake = {
-                        "type": "robot_connect",
-                        "robot_id": self.robot_id,
-                        "stream_key": self.stream_key,
-                    }
-                else:
-                    handshake = {"command": self.stream_key}
-                await websocket.send(json.dumps(handshake))
-                self.logger.info(f"Sent handshake: {handshake}")
-
-                # Track last pong time for ping-pong
-                pong_time = asyncio.get_event_loop().time()
+            websocket = await websockets.connect(url)
+        except Exception as e:
+            self.logger.error(f"WebSocket connect error: {e}")
+            self.discovery.invalidate("control")
+            return False
 
-                async def ping_pong():
-                    nonlocal pong_time
-                    while not self.async_stop_event.is_set():
-                        await asyncio.sleep(5)
-                        try:
-                            await websocket.send(json.dumps({"command": "RS_PING"}))
-                            self.logger.debug("Sent RS_PING")
-                        except Exception as e:
-                            self.logger.error(f"Ping error: {e}")
-                        # Check pong timeout
-                        if asyncio.get_event_loop().time() - pong_time > 60:
-                            self.logger.error(
-                                "No RS_PONG received in 60s, closing connection."
-                            )
-                            await websocket.close()
-                            break
+        try:
+            self.ws = websocket
+            # wait_for_pong() waits for this connection's pong, not the last one's
+            self.pong_event.clear()
+            # Handshake
+            if h["protocol"] == "wss":
+                # Construct a RS legal handshake
+                handshake = {
+                    "type": "robot_connect",
+                    "robot_id": self.robot_id,
+                    "stream_key": self.stream_key,
+                }
+            else:
+                handshake = {"command": self.stream_key}
+            await websocket.send(json.dumps(handshake))
+            self.logger.info(f"Sent handshake: {handshake}")
+
+            if self.disconnected_at is not None:
+                self.reconnect_count += 1
+                self.last_recovery_seconds = loop.time() - self.disconnected_at
+                CONTROL_RECONNECTS.inc(robot=self.robot_id)
+                CONTROL_RECOVERY.set(self.last_recovery_seconds, robot=self.robot_id)
+                self.disconnected_at = None
+                self.logger.info(
+                    f"Control WebSocket recovered in {self.last_recovery_seconds:.2f}s "
+                    f"(reconnect #{self.reconnect_count})"
+                )
 
-                async def receive_loop():
-                    nonlocal pong_time
+            CONTROL_CONNECTED.set(1, robot=self.robot_id)
+
+            # Track last pong time for ping-pong
+            pong_time = loop.time()
+            # Only one ping is out at a time, so each RS_PONG is timed against the ping
+            # it answers and a lost pong can't skew the RTTs after it
+            ping_queued = None  # When the outstanding ping was queued
+            ping_sent = None  # When it was written to the socket
+
+            def sent(message, priority):
+                # Pings are timed from when they're written, not queued, so the
+                # RTT doesn't include time spent behind the send queue
+                nonlocal ping_sent
+                if priority == CONTROL:
+                    ping_sent = loop.time()
+
+            async def ping_pong():
+                nonlocal ping_queued, ping_sent
+                # The first ping goes straight after the handshake, so startup isn't
+                # held up waiting for a pong
+                while not self.async_stop_event.is_set():
                     try:
-                        async for message in websocket:
-                            # Log messages we get but only mark important/user messages as info
-                            try:
-                                j = json.loads(message)
-                                if (
-                                    j.get("command") == "RS_PONG"
-                                    or j.get("type") == "RS_PING"
-                                ):
-                                    pong_time = asyncio.get_event_loop().time()
-                                    self.pong_event.set()
-
-                                # Forward to relay clients
-                                await self.send_to_relay_clients(message)
-                            except Exception:
-                                pass
-                    except websockets.ConnectionClosed:
-                        self.logger.info("WebSocket connection closed.")
+                        # A ping unanswered this long has lost its pong, stop waiting for it
+                        if ping_queued is None or loop.time() - ping_queued > PING_LOST_AFTER:
+                            ping_queued, ping_sent = loop.time(), None
+                            self.upstream.put(json.dumps({"command": "RS_PING"}), CONTROL)
+                            self.logger.debug("Queued RS_PING")
                     except Exception as e:
-                        self.logger.error(f"WebSocket receive error: {e}")
-
-                # Start ping-pong and receive tasks
-                self.ping_task = asyncio.create_task(ping_pong())
-                self.receive_task = asyncio.create_task(receive_loop())
-
-                # Wait for stop event
-                await self.async_stop_event.wait()
-                # Clean up
+                        self.logger.error(f"Ping error: {e}")
+                    # Check pong timeout
+                    if loop.time() - pong_time > 60:
+                        self.logger.error(
+                            "No RS_PONG received in 60s, closing connection."
+                        )
+                        await websocket.close()
+                        break
+                    await asyncio.sleep(5)
+
+            async def receive_loop():
+                nonlocal pong_time, ping_queued, ping_sent
+                try:
+                    async for message in websocket:
+                        received_at = time.monotonic()
+                        received_wall = time.time() if self.trace else None
+                        UPSTREAM_MESSAGES.inc(robot=self.robot_id)
+                        # Log messages we get but only mark important/user messages as info
+                        try:
+                            j = json.loads(message)
+                            if (
+                                j.get("command") == "RS_PONG"
+                                or j.get("type") == "RS_PING"
+                            ):
+                                pong_time = loop.time()
+                                if j.get("command") == "RS_PONG":
+                                    if ping_sent is not None:
+                                        self.last_ping_rtt = pong_time - ping_sent
+                                        PING_RTT.observe(self.last_ping_rtt, robot=self.robot_id)
+                                    ping_queued = ping_sent = None
+                                self.pong_event.set()
+
+                            # Forward to relay clients
+                            trace = None
+                            if self.trace and isinstance(j, dict):
+                                trace = {
+                                    "message": j,
+                                    "upstream_rx": received_wall,
+                                    "ping_rtt": self.last_ping_rtt,
+                                }
+                            self.relay.broadcast(
+                                message, received_at, trace, robot=self.robot_id, parsed=j
+                            )
+                        except Exception:
+                            pass
+                    self.logger.info("WebSocket connection closed.")
+                except websockets.ConnectionClosed:
+                    self.logger.info("WebSocket connection closed.")
+                except Exception as e:
+                    self.logger.error(f"WebSocket receive error: {e}")
+
+            # Start ping-pong, receive and send tasks. Pings left over from the
+            # last session are stale, queued relay messages still go out.
+            self.upstream.clear_control()
+            self.ping_task = asyncio.create_task(ping_pong())
+            self.receive_task = asyncio.create_task(receive_loop())
+            send_task = asyncio.create_task(self.upstream.send_to(websocket, on_sent=sent))
+            stop_task = asyncio.create_task(self.async_stop_event.wait())
+
+            # Run until upstream drops or we are asked to stop
+            await asyncio.wait(
+                {self.receive_task, send_task, stop_task},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if send_task.done() and not send_task.cancelled() and send_task.exception():
+                self.logger.error(f"WebSocket send error: {send_task.exception()}")
+            # Clean up
+            for task in (self.ping_task, self.receive_task, send_task, stop_task):
+                task.cancel()
+            if self.async_stop_event.is_set():
                 self.logger.info("Shutting down WebSocket handler...")
-                self.ping_task.cancel()
-                self.receive_task.cancel()
-                await websocket.close()
-                self.logger.info("WebSocket closed cleanly.")
-                # Stop relay server
-                self.relay_server.close()
-                await self.relay_server.wait_closed()
-                self.logger.info("Relay WebSocket server stopped.")
+            return True
         except Exception as e:
             self.logger.error(f"WebSocket error: {e}")
+            return False
+        finally:
+            self.ws = None
+            CONTROL_CONNECTED.set(0, robot=self.robot_id)
+            await websocket.close()
+            self.logger.info("WebSocket closed.")
 
-    def send_camera_alive_message(self):
-        """Send a camera alive message to the robotstreamer API every 5 seconds in a background thread."""
+    def send_upstream(self, message, key=None):
+        """
+        Queue a message from a relay client for the control WebSocket. Messages
+        with the same coalesce key replace each other while they wait.
+        """
+        self.upstream.put(message, BULK, key)
 
-        def makePOST(url, data):
+    async def alive_loop(self):
+        """Post a camera alive message to the robotstreamer API every 5 seconds."""
+        url = f"{self.api_url}/v1/set_camera_status"
+        while True:
+            self.logger.debug("sending camera alive message")
             try:
-                resp = requests.post(url, json=data)
-                self.logger.debug(f"Camera alive POST {url} status {resp.status_code}")
-            except Exception as e:
-                self.logger.error(f"Could not make post to {url}: {e}")
-
-        def alive_loop():
-            url = f"{self.api_url}/v1/set_camera_status"
-            while not getattr(self, "_stop_alive", False):
-                self.logger.debug("sending camera alive message")
-                makePOST(
+                status = await self.http_post(
                     url,
                     {
                         "camera_id": self.camera_id,
@@ -224,46 +456,42 @@ class APIClient:
                         "stream_key": self.stream_key,
                         "type": "robot_git",
                     },
+                    "set_camera_status",
                 )
-                for _ in range(5):
-                    if getattr(self, "_stop_alive", False):
-                        break
-                    time.sleep(1)
-
-        import threading, time
-
-        self._stop_alive = False
-        self._alive_thread = threading.Thread(target=alive_loop, daemon=True)
-        self._alive_thread.start()
-
-    def stop_camera_alive_message(self):
-        self._stop_alive = True
-        if hasattr(self, "_alive_thread"):
-            self._alive_thread.join()
-
-    def start(self):
-        # Start the asyncio event loop in a background thread
-        def run():
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-            self.loop.run_until_complete(self.ws_handler())
-
-        self.thread = threading.Thread(target=run, daemon=True)
-        self.thread.start()
+                self.logger.debug(f"Camera alive POST {url} status {status}")
+            except Exception as e:
+                self.logger.error(f"Could not make post to {url}: {e}")
+            await asyncio.sleep(5)
+
+    async def start(self):
+        if self.http is None:
+            self.http = make_http_session()
+        self.relay.add_upstream(self.robot_id, self.send_upstream)
+        self.ws_task = asyncio.create_task(self.ws_handler())
+        self.alive_task = asyncio.create_task(self.alive_loop())
         self.logger.info("WebSocket client started.")
-        self.send_camera_alive_message()
-
-    def stop(self):
-        # Signal async tasks to stop and wait for thread to finish
-        self.stop_event.set()
-        if self.async_stop_event:
-            self.loop.call_soon_threadsafe(self.async_stop_event.set)
-        if self.thread:
-            self.thread.join()
-        self.stop_camera_alive_message()
+
+    async def stop(self):
+        # Signal the handler to close cleanly, cancel it if it doesn't
+        self.async_stop_event.set()
+        self.relay.remove_upstream(self.robot_id)
+        if self.alive_task:
+            self.alive_task.cancel()
+        for task in (self.ws_task, self.alive_task):
+            if task is None:
+                continue
+            try:
+                await asyncio.wait_for(task, 5)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+            except Exception as e:
+                self.logger.error(f"WebSocket client task failed: {e}")
+        self.discovery.close()
+        if self._owns_http and self.http:
+            await self.http.close()
         self.logger.info("WebSocket client stopped.")
 
-    def get_jsmpeg_endpoint(self, kind="video"):
+    async def get_jsmpeg_endpoint(self, kind="video"):
         """
         Query the robotstreamer API for the jsmpeg video or audio endpoint for this robot.
         kind: 'video' or 'audio'
@@ -279,19 +507,22 @@ class APIClient:
         url = f"{self.api_url}/v1/get_endpoint/{endpoint}/{self.camera_id}"
         self.logger.info(f"Querying {kind} endpoint: {url}")
         try:
-            resp = requests.get(url)
-            data = resp.json()
+            data = await self.http_get(url, f"get_endpoint/{endpoint}")
             self.logger.info(f"{kind.capitalize()} endpoint response: {data}")
             return data  # Should contain 'host' and 'port'
         except Exception as e:
             self.logger.error(f"Failed to get jsmpeg {kind} endpoint: {e}")
             return None
 
-    def get_jsmpeg_video_endpoint(self):
-        return self.get_jsmpeg_endpoint("video")
+    async def get_jsmpeg_video_endpoint(self):
+        return await self.get_jsmpeg_endpoint("video")
 
-    def get_jsmpeg_audio_endpoint(self):
-        return self.get_jsmpeg_endpoint("audio")
+    async def get_jsmpeg_audio_endpoint(self):
+        return await self.get_jsmpeg_endpoint("audio")
 
-    def wait_for_pong(self, timeout=10):
-        return self.pong_event.wait(timeout)
+    async def wait_for_pong(self, timeout=10):
+        try:
+            await asyncio.wait_for(self.pong_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
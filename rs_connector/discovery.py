@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/rs_connector/endpoints.json")
+
+
+class Discovery:
+    """
+    Cached robotstreamer endpoint lookups.
+
+    Each key ('control', 'video', 'audio') maps to a fetch coroutine. Lookups for
+    several keys run concurrently, results are cached for `ttl` seconds and the
+    last known-good values are written to disk. Entries loaded from disk are
+    served immediately and revalidated in the background.
+    """
+
+    def __init__(self, fetchers, cache_id, ttl=300, cache_path=DEFAULT_CACHE_PATH):
+        self.fetchers = fetchers  # key -> coroutine function returning a dict or None
+        self.cache_id = str(cache_id)
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.entries = {}  # key -> (value, fetched_at, verified)
+        self.revalidating = {}  # key -> background refresh task
+
+        self.logger = logging.getLogger("Discovery")
+        self.load()
+
+    # ================================
+    # Disk persistence
+    # ================================
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path) as f:
+                stored = json.load(f).get(self.cache_id, {})
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.logger.warning(f"Could not read endpoint cache {self.cache_path}: {e}")
+            return
+        for key, entry in stored.items():
+            if key in self.fetchers and entry.get("value"):
+                self.entries[key] = (entry["value"], entry.get("time", 0), False)
+        if self.entries:
+            self.logger.info(
+                f"Warm start with cached endpoints: {sorted(self.entries)}"
+            )
+
+    def save(self):
+        if not self.cache_path:
+            return
+        # A small file written from the loop thread, so robots sharing it can't interleave
+        try:
+            try:
+                with open(self.cache_path) as f:
+                    stored = json.load(f)
+            except (FileNotFoundError, ValueError):
+                stored = {}
+            stored[self.cache_id] = {
+                key: {"value": value, "time": fetched_at}
+                for key, (value, fetched_at, _) in self.entries.items()
+            }
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp = f"{self.cache_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(stored, f)
+            os.replace(tmp, self.cache_path)
+        except Exception as e:
+            self.logger.warning(f"Could not write endpoint cache {self.cache_path}: {e}")
+
+    # ================================
+    # Lookups
+    # ================================
+    async def fetch(self, key):
+        value = await self.fetchers[key]()
+        if value:
+            self.entries[key] = (value, time.time(), True)
+        return value
+
+    def revalidate(self, key):
+        if key in self.revalidating:
+            return
+
+        async def run():
+            try:
+                if await self.fetch(key):
+                    self.logger.debug(f"Revalidated {key} endpoint")
+                    self.save()
+            except Exception as e:
+                self.logger.warning(f"Could not revalidate {key} endpoint: {e}")
+            finally:
+                self.revalidating.pop(key, None)
+
+        self.revalidating[key] = asyncio.create_task(run())
+
+    async def resolve(self, *keys):
+        """
+        Return {key: endpoint} for the given keys. Fresh cache hits return
+        immediately, stale or unverified hits return immediately and are refreshed
+        in the background, and misses are fetched concurrently.
+        """
+        now = time.time()
+        results = {}
+        missing = []
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                missing.append(key)
+                continue
+            value, fetched_at, verified = entry
+            results[key] = value
+            if not verified or now - fetched_at > self.ttl:
+                self.revalidate(key)
+
+        if missing:
+            fetched = await asyncio.gather(
+                *(self.fetch(key) for key in missing), return_exceptions=True
+            )
+            for key, value in zip(missing, fetched):
+                if isinstance(value, Exception):
+                    self.logger.error(f"Failed to look up {key} endpoint: {value}")
+                    value = None
+                results[key] = value
+            self.save()
+        return results
+
+    async def get(self, key):
+        return (await self.resolve(key))[key]
+
+    def invalidate(self, *keys):
+        """Drop cached entries that turned out not to work."""
+        for key in keys:
+            self.entries.pop(key, None)
+        self.logger.info(f"Invalidated cached endpoints: {list(keys)}")
+        self.save()
+
+    def close(self):
+        for task in list(self.revalidating.values()):
+            task.cancel()
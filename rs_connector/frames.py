@@ -0,0 +1,170 @@
+import time
+import asyncio
+import logging
+import threading
+import collections
+from .metrics import REGISTRY
+
+FRAMES_DROPPED = REGISTRY.counter(
+    "rs_frame_source_dropped_total",
+    "Frames dropped by a Python frame source because the encoder fell behind",
+    ("robot",),
+)
+FRAMES_REPEATED = REGISTRY.counter(
+    "rs_frame_source_repeated_total",
+    "Frames repeated by a Python frame source because no new frame was ready",
+    ("robot",),
+)
+
+# Bytes per pixel for the raw formats a FrameSource can carry
+PIXEL_SIZES = {"rgb24": 3, "bgr24": 3, "rgba": 4, "bgra": 4, "gray": 1, "yuv420p": 1.5}
+
+
+class FrameRing:
+    """
+    Fixed ring of preallocated frame slots shared by one producer and one consumer.
+
+    Producers fill a slot in place through a writable memoryview (acquire/commit)
+    and the consumer reads it in place (each pop() releases the previous frame), so
+    no frame is ever copied inside the ring. When every slot is taken the oldest ready frame is dropped.
+    """
+
+    def __init__(self, frame_size, slots=4, robot=""):
+        if slots < 3:
+            raise ValueError("FrameRing needs at least 3 slots")
+        self.frame_size = frame_size
+        self.buffer = bytearray(frame_size * slots)
+        self.view = memoryview(self.buffer)
+        self.free = collections.deque(range(slots))
+        self.ready = collections.deque()
+        self.writing = None
+        self.reading = None
+        self.dropped = 0
+        self.robot = robot  # Robot ID for the metric labels
+        self.cond = threading.Condition()
+
+    def slot(self, index):
+        return self.view[index * self.frame_size : (index + 1) * self.frame_size]
+
+    def acquire(self):
+        """Return a writable memoryview for the next frame. Call commit() when filled."""
+        with self.cond:
+            if self.free:
+                index = self.free.popleft()
+            else:
+                # Encoder is behind, drop the oldest frame it hasn't picked up yet
+                index = self.ready.popleft()
+                self.dropped += 1
+                FRAMES_DROPPED.inc(robot=self.robot)
+            self.writing = index
+        return self.slot(index)
+
+    def commit(self):
+        with self.cond:
+            self.ready.append(self.writing)
+            self.writing = None
+            self.cond.notify()
+
+    def push(self, frame):
+        """Copy a complete frame (any bytes-like object) into the ring."""
+        self.acquire()[:] = frame
+        self.commit()
+
+    def pop(self, timeout=None):
+        """
+        Return a read-only memoryview of the oldest ready frame, or None on timeout.
+        The previously popped frame is released back to the ring.
+        """
+        with self.cond:
+            if not self.ready and not self.cond.wait_for(lambda: self.ready, timeout):
+                return None
+            index = self.ready.popleft()
+            if self.reading is not None:
+                self.free.append(self.reading)
+            self.reading = index
+        return self.slot(index).toreadonly()
+
+
+class FrameSource:
+    """
+    Video input fed from Python: overlays, synthetic patterns, processed camera frames.
+
+    Producers call push(frame) or fill acquire() in place and commit(), from any
+    thread. The streamer runs feed() against ffmpeg's stdin as a task, which
+    writes one frame per output tick at the configured rate. It repeats the last
+    frame when the producer is idle. When ffmpeg can't keep up the writes wait,
+    the ring fills and the oldest frames are dropped.
+    """
+
+    def __init__(self, width, height, framerate=25, pix_fmt="rgb24", slots=4):
+        if pix_fmt not in PIXEL_SIZES:
+            raise ValueError(f"Unsupported pixel format: {pix_fmt}")
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.pix_fmt = pix_fmt
+        self.frame_size = int(width * height * PIXEL_SIZES[pix_fmt])
+        self.ring = FrameRing(self.frame_size, slots)
+
+        self.logger = logging.getLogger("FrameSource")
+
+    @property
+    def robot(self):
+        """Robot ID the frame metrics are labelled with, set by the streamer it feeds."""
+        return self.ring.robot
+
+    @robot.setter
+    def robot(self, robot):
+        self.ring.robot = robot
+
+    def input_args(self):
+        return (
+            f"-f rawvideo -pix_fmt {self.pix_fmt} -video_size {self.width}x{self.height} "
+            f"-framerate {self.framerate} -i pipe:0"
+        )
+
+    def push(self, frame):
+        if len(frame) != self.frame_size:
+            raise ValueError(f"Frame is {len(frame)} bytes, expected {self.frame_size}")
+        self.ring.push(frame)
+
+    def acquire(self):
+        return self.ring.acquire()
+
+    def commit(self):
+        self.ring.commit()
+
+    async def feed(self, writer):
+        """
+        Write frames to writer (ffmpeg's stdin) at the source frame rate until
+        cancelled or ffmpeg goes away.
+        """
+        interval = 1 / self.framerate
+        frame = None
+        next_tick = time.monotonic()
+        try:
+            while True:
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Take the freshest frame, or repeat the last one if nothing new arrived
+                new = self.ring.pop(timeout=0)
+                if new is not None:
+                    frame = new
+                elif frame is None:
+                    # Nothing produced yet
+                    next_tick = time.monotonic() + interval
+                    continue
+                else:
+                    FRAMES_REPEATED.inc(robot=self.robot)
+
+                writer.write(frame)
+                # Waits while ffmpeg is behind, the ring drops frames meanwhile
+                await writer.drain()
+
+                next_tick += interval
+                if next_tick < time.monotonic():
+                    # ffmpeg stalled us, don't burst to catch up
+                    next_tick = time.monotonic()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            self.logger.debug(f"Frame feed ended: {e}")
@@ -1,10 +1,73 @@
 import os
-import time
+import signal
 import logging
-import coloredlogs
 import asyncio
-from .streamer import Streamer
-from .api_client import APIClient
+import coloredlogs
+from .pipeline import Pipeline, PipelineGroup, load_config
+from .api_client import make_http_session
+from .relay import RelayServer
+from .profiling import LoopMonitor, PROFILER
+
+
+async def run():
+    # Ctrl+C and docker stop cancel the main task; every task cleans up on the way out
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+
+    # Opt-in event loop instrumentation, for finding what stalls robot commands
+    monitor = None
+    if os.environ.get("LOOP_MONITOR", "").lower() in ("1", "true", "yes"):
+        monitor = LoopMonitor(
+            interval=float(os.environ.get("LOOP_LAG_INTERVAL", 0.5)),
+            slow_threshold=float(os.environ.get("LOOP_SLOW_THRESHOLD", 0.25)),
+        )
+        monitor.start()
+    PROFILER.output_dir = os.environ.get("PROFILE_DIR") or None
+    PROFILER.default_seconds = float(os.environ.get("PROFILE_SECONDS", 30))
+    PROFILER.token = os.environ.get("PROFILE_TOKEN") or None
+    if PROFILER.enabled:
+        # kill -USR1 <pid> profiles a running connector without restarting it
+        loop.add_signal_handler(signal.SIGUSR1, PROFILER.trigger, None, "signal")
+    try:
+        await run_pipelines()
+    finally:
+        if monitor:
+            await monitor.stop()
+
+
+async def run_pipelines():
+    # Several cameras/robots in one process, described by a config file
+    config_path = os.environ.get("RS_CONFIG")
+    if config_path:
+        try:
+            configs = load_config(config_path)
+        except Exception as e:
+            logging.error(f"Could not load RS_CONFIG {config_path}: {e}")
+            return
+        http_session = make_http_session(pool_maxsize=max(6, 4 * len(configs)))
+        relay = RelayServer(
+            queue_size=int(os.environ.get("RELAY_QUEUE_SIZE", 100)),
+            overflow_policy=os.environ.get("RELAY_OVERFLOW_POLICY", "drop_oldest"),
+            history_size=int(os.environ.get("RELAY_HISTORY", 1000)),
+            snapshot_size=int(os.environ.get("RELAY_SNAPSHOT_SIZE", 1000)),
+            compression=os.environ.get("RELAY_COMPRESSION", "small"),
+            accept_upstream=os.environ.get("RELAY_UPSTREAM", "").lower() in ("1", "true", "yes"),
+        )
+        try:
+            await PipelineGroup(configs, http_session, relay).run()
+        finally:
+            await http_session.close()
+        return
+
+    # Single robot configured from the environment
+    try:
+        pipeline = Pipeline()
+    except ValueError as e:
+        logging.error(f"{e} Exiting.")
+        return
+    await pipeline.run()
 
 
 def main():
@@ -16,93 +79,10 @@ def main():
         logger=logging.getLogger(),
     )
 
-    # Get environment variables
-    video_device = os.environ.get("VIDEO_DEVICE", "rs_connector/test_pattern.jpg")
-    stream_type = os.environ.get("STREAM_TYPE", "jsmpeg").lower()
-    stream_key = os.environ.get("STREAM_KEY", "")
-    robot_id = os.environ.get("ROBOT_ID")
-    camera_id = os.environ.get("CAMERA_ID")
-    api_url = os.environ.get("API_URL")
-    ffmpeg_opts = os.environ.get("FFMPEG_OPTS", "")
-    xres = int(os.environ.get("VIDEO_XRES", 768))
-    yres = int(os.environ.get("VIDEO_YRES", 432))
-    framerate = int(os.environ.get("VIDEO_FRAMERATE", 25))
-    kbps = int(os.environ.get("VIDEO_KBPS", 700))
-
-    # Validate environment variables
-    if not robot_id:
-        logging.error("ROBOT_ID not set. Exiting.")
-        return
-    if not stream_key:
-        logging.error("STREAM_KEY not set. Exiting.")
-        return
-
-    # Initialize streamer and API client
-    streamer = Streamer(video_device, robot_id, stream_key, ffmpeg_opts)
-    api_client = APIClient(robot_id, camera_id, stream_key, api_url)
-
-    max_restarts = 5
-    restart_attempts = 0
-
     try:
-        # Start API Client
-        api_client.start()
-        # Wait for API to settle by waiting for pong
-        if not api_client.wait_for_pong(timeout=10):
-            logging.error("Did not receive pong from control WebSocket. Exiting.")
-            return
-
-        while True:
-            if stream_type == "rtmp":
-                streamer.start_stream()
-
-            # jsmpeg robot streams
-            elif stream_type == "jsmpeg":
-                # Get Endpoints
-                video_endpoint = api_client.get_jsmpeg_video_endpoint()
-                audio_endpoint = api_client.get_jsmpeg_audio_endpoint()
-                logging.info(
-                    f"Setting up {stream_type} with endpoints {video_endpoint} and {audio_endpoint}"
-                )
-
-                if not video_endpoint or not audio_endpoint:
-                    logging.error(
-                        "Could not get robot video or audio endpoint. Retrying in 10s."
-                    )
-                    time.sleep(10)
-                    restart_attempts += 1
-                    if restart_attempts >= max_restarts:
-                        logging.error("Max ffmpeg restart attempts reached. Exiting.")
-                        break
-                    continue
-                streamer.stream_key = stream_key or video_endpoint.get("identifier", "")
-                streamer.start_jsmpeg_stream(
-                    video_endpoint,
-                    xres=xres,
-                    yres=yres,
-                    framerate=framerate,
-                    kbps=kbps,
-                    audio_endpoint=audio_endpoint,
-                )
-                while True:
-                    time.sleep(1)
-            else:
-                logging.error(f"Unknown STREAM_TYPE: {stream_type}")
-                return
-
-            logging.error("ffmpeg process not running!")
-            restart_attempts += 1
-            if restart_attempts >= max_restarts:
-                logging.error("Max ffmpeg restart attempts reached. Exiting.")
-                break
-            logging.info("Attempting to restart ffmpeg in 5 seconds...")
-            time.sleep(5)
-
-    except KeyboardInterrupt:
-        logging.info("Shutting down...")
-    finally:
-        streamer.stop_stream()
-        api_client.stop()
+        asyncio.run(run())
+    except asyncio.CancelledError:
+        logging.info("Shut down.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+import os
+import json
+import logging
+import asyncio
+from .streamer import Streamer
+from .api_client import APIClient
+from .discovery import DEFAULT_CACHE_PATH
+from .static import DEFAULT_CACHE_DIR as STATIC_CACHE_DIR
+from .abr import BitrateController, build_ladder
+from .startup import StartupTimeline
+
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def load_config(path):
+    """
+    Read an RS_CONFIG file: a JSON list of pipelines, or {"pipelines": [...]}.
+    Each pipeline is a dict of the usual environment variable names
+    (ROBOT_ID, CAMERA_ID, STREAM_KEY, VIDEO_DEVICE, ...).
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if isinstance(config, dict):
+        config = config.get("pipelines", [])
+    if not isinstance(config, list) or not config:
+        raise ValueError(f"{path} does not define any pipelines")
+    return config
+
+
+class Pipeline:
+    """
+    One camera/robot: its API client, streamer and optional ABR controller.
+
+    Settings are looked up in `overrides` first and the environment second, so a
+    single-robot setup is just a Pipeline with no overrides. http_session and
+    relay are shared when several pipelines run in one process.
+    """
+
+    def __init__(self, overrides=None, http_session=None, relay=None):
+        overrides = overrides or {}
+
+        def get(key, default=None):
+            value = overrides.get(key, os.environ.get(key))
+            return default if value is None else value
+
+        self.stream_type = get("STREAM_TYPE", "jsmpeg").lower()
+        self.stream_key = get("STREAM_KEY", "")
+        self.robot_id = get("ROBOT_ID")
+        self.camera_id = get("CAMERA_ID")
+        self.xres = int(get("VIDEO_XRES", 768))
+        self.yres = int(get("VIDEO_YRES", 432))
+        self.framerate = int(get("VIDEO_FRAMERATE", 25))
+        self.kbps = int(get("VIDEO_KBPS", 700))
+        self.abr_enabled = _flag(get("ABR_ENABLED", ""))
+        self.min_kbps = int(get("VIDEO_MIN_KBPS", self.kbps // 4))
+        self.min_scale = float(get("VIDEO_MIN_SCALE", 0.5))
+        self.abr_steps = int(get("ABR_STEPS", 4))
+        self.video_enabled = _flag(get("VIDEO_ENABLED", "1"))
+        self.audio_enabled = _flag(get("AUDIO_ENABLED", "1"))
+        self.audio_sample_rate = int(get("AUDIO_SAMPLE_RATE", 32000))
+        self.audio_channels = int(get("AUDIO_CHANNELS", 1))
+        self.audio_kbps = int(get("AUDIO_KBPS", 64))
+
+        # Validate settings
+        if not self.robot_id:
+            raise ValueError("ROBOT_ID not set.")
+        if not self.stream_key:
+            raise ValueError("STREAM_KEY not set.")
+        if not (self.video_enabled or self.audio_enabled):
+            raise ValueError("VIDEO_ENABLED and AUDIO_ENABLED are both off.")
+        self.robot_id = str(self.robot_id)
+
+        self.logger = logging.getLogger(f"Pipeline[{self.robot_id}]")
+        self.bitrate_controller = None
+        self.timeline = StartupTimeline(self.robot_id)
+
+        # Initialize streamer and API client
+        self.streamer = Streamer(
+            get("VIDEO_DEVICE", "rs_connector/test_pattern.jpg"),
+            self.robot_id,
+            self.stream_key,
+            get("FFMPEG_OPTS", ""),
+            max_crashes=int(get("FFMPEG_MAX_CRASHES", 5)),
+            crash_window=int(get("FFMPEG_CRASH_WINDOW", 120)),
+            static_loop=_flag(get("STATIC_LOOP", "1")),
+            static_cache_dir=get("STATIC_CACHE_DIR", STATIC_CACHE_DIR),
+            rtmp_outputs=[u.strip() for u in get("RTMP_OUTPUTS", "").split(",") if u.strip()],
+            record_dir=get("RECORD_DIR") or None,
+            record_segment_seconds=int(get("RECORD_SEGMENT_SECONDS", 60)),
+            record_segments=int(get("RECORD_SEGMENTS", 60)),
+            record_codec=get("RECORD_CODEC", "mpeg1video"),
+            video_enabled=self.video_enabled,
+            audio_enabled=self.audio_enabled,
+            audio_device=get("AUDIO_DEVICE") or None,
+            audio_input_format=get("AUDIO_INPUT_FORMAT", "alsa"),
+        )
+        self.api_client = APIClient(
+            self.robot_id,
+            self.camera_id,
+            self.stream_key,
+            get("API_URL"),
+            relay_queue_size=int(get("RELAY_QUEUE_SIZE", 100)),
+            relay_overflow_policy=get("RELAY_OVERFLOW_POLICY", "drop_oldest"),
+            relay_history_size=int(get("RELAY_HISTORY", 1000)),
+            relay_snapshot_size=int(get("RELAY_SNAPSHOT_SIZE", 1000)),
+            relay_compression=get("RELAY_COMPRESSION", "small"),
+            relay_upstream=_flag(get("RELAY_UPSTREAM", "")),
+            http_session=http_session,
+            discovery_ttl=int(get("DISCOVERY_TTL", 300)),
+            discovery_cache_path=get("DISCOVERY_CACHE", DEFAULT_CACHE_PATH),
+            trace=_flag(get("CONTROL_TRACE", "")),
+            relay=relay,
+            upstream_rate=float(get("UPSTREAM_RATE", 10)),
+            upstream_burst=int(get("UPSTREAM_BURST", 20)),
+            upstream_queue_size=int(get("UPSTREAM_QUEUE_SIZE", 100)),
+        )
+
+    async def start_stream(self):
+        """
+        Discover the ingest endpoints and start streaming, warming up the encoder
+        at the same time. Returns False if the stream couldn't be started.
+        """
+        api_client = self.api_client
+        streamer = self.streamer
+        timeline = self.timeline
+
+        if self.stream_type == "rtmp":
+            await timeline.phase(
+                "stream_start", streamer.start_stream(self.xres, self.yres, self.framerate)
+            )
+            return True
+        if self.stream_type != "jsmpeg":
+            self.logger.error(f"Unknown STREAM_TYPE: {self.stream_type}")
+            return False
+
+        # jsmpeg robot streams, only the ingests we're sending to need to be found
+        kinds = [
+            kind
+            for kind, enabled in (("video", self.video_enabled), ("audio", self.audio_enabled))
+            if enabled
+        ]
+        max_restarts = 5
+        restart_attempts = 0
+        # The static image loop can be encoded before we know where it goes
+        warm_up = asyncio.create_task(
+            timeline.phase(
+                "warm_up",
+                streamer.warm_up(self.xres, self.yres, self.framerate, self.kbps),
+            )
+        )
+        try:
+            while True:
+                # Get Endpoints (looked up concurrently, served from cache when possible)
+                endpoints = await timeline.phase(
+                    "discovery", api_client.discovery.resolve(*kinds)
+                )
+                video_endpoint = endpoints.get("video")
+                audio_endpoint = endpoints.get("audio")
+                self.logger.info(
+                    f"Setting up {self.stream_type} with endpoints {video_endpoint} and {audio_endpoint}"
+                )
+                if all(endpoints[kind] for kind in kinds):
+                    break
+
+                self.logger.error(
+                    f"Could not get robot {' or '.join(kinds)} endpoint. Retrying in 10s."
+                )
+                api_client.discovery.invalidate(*kinds)
+                restart_attempts += 1
+                if restart_attempts >= max_restarts:
+                    self.logger.error("Max ffmpeg restart attempts reached. Exiting.")
+                    return False
+                await asyncio.sleep(10)
+            await warm_up
+        finally:
+            warm_up.cancel()
+
+        streamer.stream_key = self.stream_key or (video_endpoint or audio_endpoint).get(
+            "identifier", ""
+        )
+
+        async def refresh_endpoints(*refresh):
+            # A video or audio stream died, its cached ingest endpoint may be stale
+            refresh = refresh or kinds
+            api_client.discovery.invalidate(*refresh)
+            endpoints = await api_client.discovery.resolve(*refresh)
+            return endpoints.get("video"), endpoints.get("audio")
+
+        streamer.on_ffmpeg_exit = refresh_endpoints
+        await timeline.phase(
+            "stream_start",
+            streamer.start_jsmpeg_stream(
+                video_endpoint,
+                xres=self.xres,
+                yres=self.yres,
+                framerate=self.framerate,
+                kbps=self.kbps,
+                audio_endpoint=audio_endpoint,
+                audio_sample_rate=self.audio_sample_rate,
+                audio_channels=self.audio_channels,
+                audio_kbps=self.audio_kbps,
+            ),
+        )
+        if self.abr_enabled and self.video_enabled:
+            self.bitrate_controller = BitrateController(
+                streamer,
+                build_ladder(
+                    self.xres,
+                    self.yres,
+                    self.kbps,
+                    self.min_kbps,
+                    self.min_scale,
+                    self.abr_steps,
+                ),
+            )
+            self.bitrate_controller.start()
+        return True
+
+    async def run(self):
+        """Run the pipeline until it stops or gives up. Cancel the task to stop it."""
+        api_client = self.api_client
+        streamer = self.streamer
+        streamer.on_first_byte = self.timeline.first_byte
+
+        # The control socket and the stream don't depend on each other, so they start
+        # together and the stream doesn't wait on the control handshake
+        control = stream = None
+        try:
+            await api_client.start()
+            # The static loops post to the ingest over the same pool as the API calls
+            streamer.http_session = api_client.http
+            control = asyncio.create_task(
+                self.timeline.phase("control", api_client.wait_for_pong(timeout=10))
+            )
+            stream = asyncio.create_task(self.start_stream())
+
+            # The control socket reconnects on its own, so a slow or failed handshake
+            # is no reason to tear down a stream that may already be up
+            if not await control:
+                self.logger.warning(
+                    "No pong from the control WebSocket yet, streaming while it reconnects."
+                )
+            if not await stream:
+                return
+
+            # The supervisors restart ffmpeg themselves, this only returns once video gives up
+            await streamer.wait()
+            if streamer.failed:
+                self.logger.error("ffmpeg is crash looping. Exiting.")
+        finally:
+            for task in (control, stream):
+                if task:
+                    task.cancel()
+            if self.bitrate_controller:
+                await self.bitrate_controller.stop()
+            await streamer.stop_stream()
+            await api_client.stop()
+
+
+class PipelineGroup:
+    """
+    Several pipelines in one process, sharing the event loop, one pooled HTTP
+    session and one relay multiplexed by robot ID. Each pipeline is its own
+    task, so one failing doesn't stop the others.
+    """
+
+    def __init__(self, configs, http_session, relay):
+        self.http = http_session
+        self.relay = relay
+        self.pipelines = []
+
+        self.logger = logging.getLogger("PipelineGroup")
+
+        for i, config in enumerate(configs):
+            try:
+                self.pipelines.append(
+                    Pipeline(config, http_session=self.http, relay=self.relay)
+                )
+            except Exception as e:
+                self.logger.error(f"Skipping pipeline #{i}: {e}")
+
+    async def run_pipeline(self, pipeline):
+        try:
+            await pipeline.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.exception(f"Pipeline for robot {pipeline.robot_id} failed: {e}")
+        else:
+            self.logger.warning(f"Pipeline for robot {pipeline.robot_id} stopped.")
+
+    async def run(self):
+        """Run every pipeline until all of them have stopped, or until cancelled."""
+        if not self.pipelines:
+            self.logger.error("No pipelines to run.")
+            return
+        await self.relay.start()
+        self.logger.info(f"Running {len(self.pipelines)} pipelines.")
+        try:
+            # return_exceptions so a cancel waits for every pipeline to clean up
+            await asyncio.gather(
+                *(self.run_pipeline(p) for p in self.pipelines), return_exceptions=True
+            )
+        finally:
+            await self.relay.stop()
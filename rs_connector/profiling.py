@@ -0,0 +1,182 @@
+import os
+import sys
+import hmac
+import math
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+import traceback
+import ipaddress
+from .metrics import REGISTRY
+
+LOOP_LAG = REGISTRY.histogram(
+    "rs_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task, i.e. how long callbacks held it",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_STALLS = REGISTRY.counter(
+    "rs_event_loop_stalls_total",
+    "Times a callback held the event loop past the slow threshold",
+)
+PROFILES = REGISTRY.counter(
+    "rs_profiles_total",
+    "On-demand profiles written, by trigger",
+    ("trigger",),
+)
+
+# Longest on-demand profile, so a typo can't leave the profiler running for a day
+MAX_PROFILE_SECONDS = 300
+
+
+class LoopMonitor:
+    """
+    Samples event loop lag and catches callbacks that block it.
+
+    A task sleeps `interval` seconds at a time and records how late it wakes
+    up. A watchdog thread checks that the task keeps waking; when it's more
+    than `slow_threshold` late, the loop is stuck in one callback right now,
+    so the watchdog logs the loop thread's stack from sys._current_frames(),
+    once per stall.
+    """
+
+    def __init__(self, interval=0.5, slow_threshold=0.25):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+
+        self.beat = time.monotonic()  # When the sampler last woke up
+        self.loop_thread = None
+        self.task = None
+        self.watchdog = None
+        self.stop_event = threading.Event()
+
+        self.logger = logging.getLogger("LoopMonitor")
+
+    async def sample(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self.beat - self.interval)
+            LOOP_LAG.observe(lag)
+            if lag > self.slow_threshold:
+                self.logger.warning(f"Event loop was blocked for {lag:.3f}s")
+
+    def watch(self):
+        reported = None
+        while not self.stop_event.wait(self.slow_threshold / 2):
+            beat = self.beat
+            late = time.monotonic() - beat - self.interval
+            if late <= self.slow_threshold or beat == reported:
+                continue
+            reported = beat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)\n"
+            self.logger.warning(
+                f"Event loop blocked for {late:.3f}s so far, it is running:\n{stack.rstrip()}"
+            )
+
+    def start(self):
+        """Start sampling the running loop. Call from the loop's thread."""
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.task = asyncio.create_task(self.sample())
+        self.stop_event.clear()
+        self.watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+        self.logger.info(
+            f"Sampling event loop lag every {self.interval}s, "
+            f"reporting callbacks that block it for over {self.slow_threshold}s"
+        )
+
+    async def stop(self):
+        self.stop_event.set()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+class Profiler:
+    """
+    On-demand, time-boxed cProfile of the event loop thread, written as a
+    .prof file (for pstats/snakeviz) plus a text summary. One at a time.
+    Disabled until output_dir is set. Over HTTP only loopback clients may
+    trigger it, unless a token is set and passed.
+    """
+
+    def __init__(self, output_dir=None, default_seconds=30, token=None):
+        self.output_dir = output_dir
+        self.default_seconds = default_seconds
+        self.token = token
+        self.task = None
+
+        self.logger = logging.getLogger("Profiler")
+
+    @property
+    def enabled(self):
+        return bool(self.output_dir)
+
+    @property
+    def running(self):
+        return bool(self.task and not self.task.done())
+
+    def authorized(self, host, token=None):
+        """Whether an HTTP client at `host` may trigger a profile."""
+        if self.token:
+            return token is not None and hmac.compare_digest(token, self.token)
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        mapped = getattr(address, "ipv4_mapped", None)
+        return (mapped or address).is_loopback
+
+    def trigger(self, seconds=None, trigger="manual"):
+        """
+        Start profiling for `seconds` in the background. Returns the path the
+        profile will be written to, or None if disabled or one is already running.
+        Raises ValueError for a length that isn't a finite number.
+        """
+        if not self.enabled or self.running:
+            return None
+        seconds = float(seconds or self.default_seconds)
+        if not math.isfinite(seconds):
+            raise ValueError(f"Profile length must be finite, got {seconds}")
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        path = os.path.join(
+            self.output_dir, f"rs-profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+        )
+        self.task = asyncio.create_task(self.run(seconds, path, trigger))
+        return path
+
+    async def run(self, seconds, path, trigger):
+        self.logger.info(f"Profiling for {seconds:.1f}s (triggered by {trigger}) into {path}")
+        profile = cProfile.Profile()
+        # cProfile only sees the thread that enabled it, which is the loop's
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profile.dump_stats(path)
+            with open(f"{os.path.splitext(path)[0]}.txt", "w") as f:
+                stats = pstats.Stats(profile, stream=f)
+                stats.sort_stats("cumulative").print_stats(40)
+                stats.sort_stats("tottime").print_stats(40)
+        except OSError as e:
+            self.logger.error(f"Could not write profile {path}: {e}")
+            return
+        PROFILES.inc(trigger=trigger)
+        self.logger.info(f"Wrote profile {path}")
+
+
+# The process-wide profiler, configured by main() and triggered by signal or the relay
+PROFILER = Profiler()
@@ -0,0 +1,129 @@
+import time
+import collections
+
+
+def _number(value, suffix=b""):
+    """Parse an ffmpeg progress value such as b'698.2kbits/s' or b'1.01x', N/A -> None."""
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class EncodeStats:
+    """Live encoder statistics for one ffmpeg output, fed from `-progress` blocks."""
+
+    def __init__(self, label):
+        self.label = label
+        self.frame = 0
+        self.fps = None
+        self.bitrate_kbps = None
+        self.speed = None
+        self.drop_frames = 0
+        self.dup_frames = 0
+        self.total_size = 0  # Bytes written to the output so far
+        self.out_time = 0.0  # Seconds of media encoded
+        self.updated_at = None
+        self.ended = False
+        # Monotonic start time and time the first output bytes were reported
+        self.started_at = time.monotonic()
+        self.first_byte_at = None
+        self.on_first_byte = None  # Called once with the start-to-first-byte latency
+
+    def update(self, block):
+        """Apply one progress block (dict of bytes -> bytes) from ffmpeg."""
+        get = block.get
+        self.set(
+            frame=int(_number(get(b"frame", b"0")) or 0),
+            fps=_number(get(b"fps", b"N/A")),
+            bitrate_kbps=_number(get(b"bitrate", b"N/A"), b"kbits/s"),
+            speed=_number(get(b"speed", b"N/A"), b"x"),
+            drop_frames=int(_number(get(b"drop_frames", b"0")) or 0),
+            dup_frames=int(_number(get(b"dup_frames", b"0")) or 0),
+            total_size=int(_number(get(b"total_size", b"0")) or 0),
+            out_time=(_number(get(b"out_time_us", b"0")) or 0) / 1e6,
+        )
+
+    def set(self, **values):
+        """Update stats directly, for outputs that are not fed by ffmpeg -progress."""
+        for key, value in values.items():
+            setattr(self, key, value)
+        self.updated_at = time.time()
+        if self.first_byte_at is None and self.total_size > 0:
+            self.first_byte_at = time.monotonic()
+            if self.on_first_byte:
+                self.on_first_byte(self.first_byte_at - self.started_at)
+
+    @property
+    def realtime(self):
+        """False when the encoder is running slower than real time."""
+        return self.speed is None or self.speed >= 1.0
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "frame": self.frame,
+            "fps": self.fps,
+            "bitrate_kbps": self.bitrate_kbps,
+            "speed": self.speed,
+            "drop_frames": self.drop_frames,
+            "dup_frames": self.dup_frames,
+            "total_size": self.total_size,
+            "out_time": self.out_time,
+            "updated_at": self.updated_at,
+            "ended": self.ended,
+        }
+
+
+async def read_progress(stream, stats):
+    """
+    Consume ffmpeg `-progress` key=value output from an asyncio StreamReader into `stats`.
+    Values are only split, never decoded or logged, until a block is complete.
+    """
+    block = {}
+    async for line in stream:
+        key, _, value = line.partition(b"=")
+        key = key.strip()
+        if key == b"progress":
+            stats.update(block)
+            block = {}
+            if value.strip() == b"end":
+                stats.ended = True
+        else:
+            block[key] = value
+
+
+class OutputTail:
+    """The last `size` bytes of a process' output, kept as raw chunks for crash reports."""
+
+    def __init__(self, size=16 * 1024):
+        self.size = size
+        self.chunks = collections.deque()
+        self.length = 0
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+        # Drop whole chunks that have scrolled out of the window
+        while self.length - len(self.chunks[0]) >= self.size:
+            self.length -= len(self.chunks.popleft())
+
+    def text(self):
+        return b"".join(self.chunks)[-self.size :].decode(errors="replace")
+
+
+async def drain_output(stream, tail, on_chunk=None, chunk_size=64 * 1024):
+    """
+    Read a binary stream to EOF in large chunks into `tail`, without splitting
+    or decoding lines. on_chunk, if given, also sees every chunk (debug logging).
+    """
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            return
+        tail.append(chunk)
+        if on_chunk:
+            on_chunk(chunk)
@@ -0,0 +1,696 @@
+import time
+import json
+import logging
+import collections
+import asyncio
+import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from .metrics import REGISTRY
+from .profiling import PROFILER
+
+try:
+    import msgpack
+except ImportError:  # Optional, clients asking for it get JSON instead
+    msgpack = None
+
+
+# Overflow policies for a relay client whose outbound queue is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# Wire formats a relay client can ask for with ?format=
+JSON = "json"
+MSGPACK = "msgpack"
+# Longest batching window a client may ask for with ?batch=<ms>
+MAX_BATCH_WINDOW = 1.0
+
+# permessage-deflate settings for RELAY_COMPRESSION. Control messages are tiny and
+# repetitive, so a small window with context takeover compresses them nearly as
+# well as the library default with a quarter of the memory per client.
+COMPRESSION = {
+    "small": {
+        "compression": None,
+        "extensions": [
+            ServerPerMessageDeflateFactory(
+                server_max_window_bits=10,
+                client_max_window_bits=10,
+                compress_settings={"memLevel": 4},
+            )
+        ],
+    },
+    "deflate": {"compression": "deflate"},
+    "none": {"compression": None},
+}
+
+FORWARD_LATENCY = REGISTRY.histogram(
+    "rs_relay_forward_latency_seconds",
+    "Time from upstream receipt of a message to it being sent to a relay client",
+)
+QUEUE_WAIT = REGISTRY.histogram(
+    "rs_relay_queue_wait_seconds",
+    "Time a message spent in the connector before its relay send started",
+)
+SEND_TIME = REGISTRY.histogram(
+    "rs_relay_send_seconds",
+    "Time spent writing a message to a relay client (consumer backpressure)",
+)
+OVERFLOW_DISCONNECTS = REGISTRY.counter(
+    "rs_relay_overflow_disconnects_total",
+    "Relay clients disconnected because their queue overflowed",
+)
+RESUMES = REGISTRY.counter(
+    "rs_relay_resumes_total",
+    "Relay clients that joined with a resume or snapshot request, by outcome",
+    ("outcome",),
+)
+
+# Message fields relay clients can filter on, e.g. ?command=F,B&user=alice.
+# "*" matches any message that has the field at all.
+FILTER_FIELDS = ("type", "command", "user")
+ANY = "*"
+
+# Upstream control messages that aren't robot state and stay out of snapshots
+NON_STATE_COMMANDS = ("RS_PING", "RS_PONG")
+
+
+def snapshot_key(message):
+    """
+    Key a message's latest state is kept under (one entry per button/command),
+    or None if it doesn't describe state.
+    """
+    if not isinstance(message, dict):
+        return None
+    command = message.get("command")
+    if not isinstance(command, str) or command in NON_STATE_COMMANDS:
+        return None
+    return command
+
+
+def filter_value(message, field):
+    """A message's value for a filter field as an index key, or None if it has none."""
+    value = message.get(field) if isinstance(message, dict) else None
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def relay_message(body):
+    """(text, parsed) for one of the relay's own messages."""
+    message = {"rs_relay": body}
+    return json.dumps(message), message
+
+
+def stamp(message, parsed, seq):
+    """
+    Add "rs_seq" to a JSON object message without re-serializing all of it.
+    Anything but a JSON object in a str goes out as it came.
+    """
+    if not isinstance(parsed, dict) or not isinstance(message, str):
+        return message
+    body = message.rstrip()
+    if not parsed or not body.endswith("}"):
+        return json.dumps({**parsed, "rs_seq": seq})
+    return f'{body[:-1]},"rs_seq":{seq}}}'
+
+
+class RelayClient:
+    """A single relay consumer with its own bounded outbound queue and drain task."""
+
+    def __init__(
+        self,
+        websocket,
+        queue_size,
+        overflow_policy,
+        robot=None,
+        filters=None,
+        wire_format=JSON,
+        batch_window=0,
+    ):
+        self.websocket = websocket
+        self.robot = robot  # Only relay this robot's messages, None for every robot
+        self.filters = filters or {}  # field -> accepted values, every field must match
+        self.overflow_policy = overflow_policy
+        self.wire_format = wire_format
+        self.batch_window = batch_window  # Seconds to collect messages into one frame, 0 for none
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self.frames = 0
+        self.drain_task = None
+
+    def wants(self, robot, parsed):
+        """Whether a message from `robot` passes this client's subscription."""
+        if self.robot is not None and robot is not None and self.robot != robot:
+            return False
+        for field, accepted in self.filters.items():
+            value = filter_value(parsed, field)
+            if value is None or (value not in accepted and ANY not in accepted):
+                return False
+        return True
+
+    def encode(self, messages):
+        """
+        One frame for a list of (text, parsed) messages: a single message as is,
+        or a batch as a list, in JSON text or MessagePack.
+        """
+        if self.wire_format == MSGPACK:
+            items = [text if parsed is None else parsed for text, parsed in messages]
+            return msgpack.packb(items if self.batch_window else items[0])
+        if not self.batch_window:
+            return messages[0][0]
+        # Already serialized messages are spliced into the list instead of re-encoded
+        return "[" + ",".join(
+            json.dumps(text) if parsed is None else text.rstrip() for text, parsed in messages
+        ) + "]"
+
+    def frames_for(self, messages):
+        """Frames to send a list of (text, parsed) messages in."""
+        if not messages:
+            return []
+        if self.batch_window:
+            return [self.encode(messages)]
+        return [self.encode([m]) for m in messages]
+
+    def enqueue(self, message, received_at, trace=None, parsed=None):
+        """
+        Queue a message without blocking.
+        Returns False if the client has overflowed and must be disconnected.
+        """
+        message = (received_at, message, parsed, trace)
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        self.dropped += 1
+        if self.overflow_policy == DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+        elif self.overflow_policy == DISCONNECT:
+            return False
+        # DROP_NEWEST: just discard the incoming message
+        return True
+
+    async def drain(self):
+        try:
+            await self.send_queued()
+        except websockets.ConnectionClosed:
+            # The handler notices the disconnect and cleans up
+            pass
+
+    async def send_queued(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.batch_window:
+                # Everything that arrives within the window goes out in the same frame
+                await asyncio.sleep(self.batch_window)
+                while not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+            dequeued_at = time.monotonic()
+            messages = []
+            for received_at, message, parsed, trace in batch:
+                if trace is not None:
+                    parsed = {
+                        **trace["message"],
+                        "rs_trace": {
+                            "upstream_rx": trace["upstream_rx"],
+                            "relay_tx": time.time(),
+                            "ping_rtt": trace["ping_rtt"],
+                        },
+                    }
+                    message = json.dumps(parsed)
+                messages.append((message, parsed))
+            await self.websocket.send(self.encode(messages))
+            sent_at = time.monotonic()
+            self.sent += len(batch)
+            self.frames += 1
+            SEND_TIME.observe(sent_at - dequeued_at)
+            for received_at, *_ in batch:
+                QUEUE_WAIT.observe(dequeued_at - received_at)
+                FORWARD_LATENCY.observe(sent_at - received_at)
+
+
+def requested_robot(path):
+    """
+    Robot a relay client subscribed to, from ws://host:port/<robot_id> or
+    ws://host:port/?robot=<robot_id>. None subscribes to every robot.
+    """
+    url = urlsplit(path or "/")
+    robot = parse_qs(url.query).get("robot", [None])[0]
+    return robot or url.path.strip("/") or None
+
+
+def requested_filters(path):
+    """
+    Filters a relay client subscribed with, e.g. ?command=F,B&user=alice.
+    Values are comma separated and a field may be repeated; any value matches.
+    """
+    query = parse_qs(urlsplit(path or "/").query)
+    filters = {}
+    for field in FILTER_FIELDS:
+        values = {v for raw in query.get(field, []) for v in raw.split(",") if v}
+        if values:
+            filters[field] = frozenset(values)
+    return filters
+
+
+def requested_wire_format(path):
+    """
+    Wire format a relay client negotiated: (format, batch window in seconds) from
+    ?format=msgpack and ?batch=<ms>. Unknown or unavailable formats fall back to JSON.
+    """
+    query = parse_qs(urlsplit(path or "/").query)
+    wire_format = query.get("format", [JSON])[0]
+    if wire_format != MSGPACK or msgpack is None:
+        wire_format = JSON
+    try:
+        batch_window = float(query.get("batch", [0])[0]) / 1000
+    except ValueError:
+        batch_window = 0
+    return wire_format, min(max(batch_window, 0), MAX_BATCH_WINDOW)
+
+
+def requested_resume(path):
+    """
+    What a relay client asked to catch up on when joining:
+    (since, epoch, snapshot) from ?since=<rs_seq>&epoch=<epoch> and ?snapshot=1.
+    """
+    query = parse_qs(urlsplit(path or "/").query)
+
+    def get(name):
+        return query.get(name, [None])[0]
+
+    try:
+        since = int(get("since")) if get("since") is not None else None
+    except ValueError:
+        since = None
+    return since, get("epoch"), get("snapshot") in ("1", "true", "yes")
+
+
+class RelayServer:
+    """
+    Local WebSocket relay. One server can carry several robots: broadcasts are
+    tagged with the robot they came from and clients choose one by path.
+
+    Every message is stamped with an increasing "rs_seq" and kept in a bounded
+    history, along with the latest message per command. A reconnecting client
+    passes ?since=<last rs_seq> to have what it missed replayed, or ?snapshot=1
+    for just the current state. Relay's own messages sit under "rs_relay".
+
+    With accept_upstream, clients can also send JSON objects, which go up their
+    robot's control WebSocket through its rate limited upstream queue. An
+    "rs_coalesce" key lets a newer message replace an older one that hasn't been
+    sent yet. It's off by default, as anyone who can reach the relay could then
+    talk to robotstreamer as the robot.
+
+    Clients can ask for messages to be batched over a short window and/or
+    encoded as MessagePack. Clients can also filter by type, command and user. Filtered clients are
+    indexed by field and value, so each message is parsed once and only checked
+    against clients that could want it.
+    """
+
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=8765,
+        queue_size=100,
+        overflow_policy=DROP_OLDEST,
+        history_size=1000,
+        snapshot_size=1000,
+        compression="small",
+        accept_upstream=False,
+        registry=REGISTRY,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown relay overflow policy: {overflow_policy}")
+        if compression not in COMPRESSION:
+            raise ValueError(f"Unknown relay compression: {compression}")
+
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.compression = compression
+        self.accept_upstream = accept_upstream
+        self.server = None
+        self.clients = {}  # websocket -> RelayClient
+        self.upstream = {}  # robot -> send(message, key) for messages from relay clients
+        self.unfiltered = set()  # Clients that get every message (for their robot)
+        self.index = {field: {} for field in FILTER_FIELDS}  # field -> value -> clients
+        # Closes of overflowed clients, referenced so they aren't garbage collected mid-close
+        self.closing = set()
+
+        # Sequence numbers restart with the process; epoch tells clients which run they belong to
+        self.epoch = str(int(time.time() * 1000))
+        self.seq = 0
+        self.history = collections.deque(maxlen=history_size)  # (rs_seq, robot, message, parsed)
+        # (robot, key) -> (rs_seq, parsed message with rs_seq), least recently updated first.
+        # Keys come from chat commands, so the oldest are evicted past snapshot_size.
+        self.latest = collections.OrderedDict()
+        self.snapshot_size = snapshot_size
+        self.registry = registry
+
+        self.logger = logging.getLogger("RelayServer")
+
+    def process_request(self, connection, request):
+        # Plain HTTP scrapes of /metrics are answered on the relay port
+        if request.path == "/metrics":
+            return connection.respond(HTTPStatus.OK, self.registry.render())
+        # So is /debug/profile?seconds=N, when profiling is enabled
+        parts = urlsplit(request.path)
+        if parts.path == "/debug/profile" and PROFILER.enabled:
+            query = parse_qs(parts.query)
+            if not PROFILER.authorized(
+                connection.remote_address[0], query.get("token", [None])[0]
+            ):
+                return connection.respond(HTTPStatus.FORBIDDEN, "Forbidden\n")
+            seconds = query.get("seconds", [None])[0]
+            try:
+                path = PROFILER.trigger(seconds, trigger="http")
+            except ValueError:
+                return connection.respond(HTTPStatus.BAD_REQUEST, "Bad seconds\n")
+            if path is None:
+                return connection.respond(HTTPStatus.CONFLICT, "A profile is already running\n")
+            return connection.respond(HTTPStatus.ACCEPTED, f"Profiling into {path}\n")
+        return None
+
+    def collect_metrics(self):
+        yield (
+            "rs_relay_clients",
+            "gauge",
+            "Connected relay clients",
+            {},
+            len(self.clients),
+        )
+        yield (
+            "rs_relay_seq",
+            "counter",
+            "Sequence number of the last relayed message",
+            {},
+            self.seq,
+        )
+        yield (
+            "rs_relay_history_messages",
+            "gauge",
+            "Messages kept for relay clients to resume from",
+            {},
+            len(self.history),
+        )
+        for websocket, client in list(self.clients.items()):
+            labels = {
+                "client": "%s:%s" % tuple(websocket.remote_address[:2]),
+                "robot": client.robot or "",
+            }
+            yield (
+                "rs_relay_client_queue_depth",
+                "gauge",
+                "Messages waiting in a relay client's queue",
+                labels,
+                client.queue.qsize(),
+            )
+            yield (
+                "rs_relay_client_dropped_total",
+                "counter",
+                "Messages dropped for a relay client by the overflow policy",
+                labels,
+                client.dropped,
+            )
+            yield (
+                "rs_relay_client_sent_total",
+                "counter",
+                "Messages delivered to a relay client",
+                labels,
+                client.sent,
+            )
+            yield (
+                "rs_relay_client_frames_total",
+                "counter",
+                "WebSocket frames sent to a relay client (less than messages when batching)",
+                labels,
+                client.frames,
+            )
+
+    def add_upstream(self, robot, send):
+        self.upstream[str(robot)] = send
+
+    def remove_upstream(self, robot):
+        self.upstream.pop(str(robot), None)
+
+    def receive(self, client, frame):
+        """
+        Pass a message from a relay client up to its robot's control WebSocket.
+        Returns an error to report back to the client, or None.
+        """
+        if not self.accept_upstream:
+            return "sending upstream is disabled on this relay (RELAY_UPSTREAM)"
+        try:
+            if isinstance(frame, bytes):
+                if msgpack is None:
+                    return "binary messages need msgpack"
+                message = msgpack.unpackb(frame)
+            else:
+                message = json.loads(frame)
+        except Exception as e:
+            return f"could not decode message: {e}"
+        if not isinstance(message, dict):
+            return "messages must be JSON objects"
+
+        robot = client.robot
+        if robot is None and len(self.upstream) == 1:
+            robot = next(iter(self.upstream))
+        send = self.upstream.get(robot)
+        if send is None:
+            if robot is None:
+                return "pick a robot to send to with ws://host:port/<robot_id>"
+            return f"robot {robot} has no control connection"
+
+        key = message.pop("rs_coalesce", None)
+        if key is not None:
+            # Keys only coalesce with the same client's messages
+            key = (id(client), str(key))
+        if key is not None or isinstance(frame, bytes):
+            frame = json.dumps(message)
+        send(frame, key)
+        return None
+
+    def add_client(self, client):
+        self.clients[client.websocket] = client
+        if not client.filters:
+            self.unfiltered.add(client)
+        for field, values in client.filters.items():
+            for value in values:
+                self.index[field].setdefault(value, set()).add(client)
+
+    def remove_client(self, client):
+        self.clients.pop(client.websocket, None)
+        self.unfiltered.discard(client)
+        for field, values in client.filters.items():
+            for value in values:
+                clients = self.index[field].get(value)
+                if clients is not None:
+                    clients.discard(client)
+                    if not clients:
+                        del self.index[field][value]
+
+    def subscribers(self, robot, parsed):
+        """Clients a message should go to, looked up through the filter index."""
+        candidates = set(self.unfiltered)
+        for field, index in self.index.items():
+            if not index:
+                continue
+            value = filter_value(parsed, field)
+            if value is None:
+                continue
+            candidates.update(index.get(value, ()))
+            candidates.update(index.get(ANY, ()))
+        return [c for c in candidates if c.wants(robot, parsed)]
+
+    def oldest_seq(self):
+        return self.history[0][0] if self.history else self.seq + 1
+
+    def catch_up(self, client, since, epoch, snapshot):
+        """
+        Messages to send a joining client ahead of live traffic, and the outcome
+        for metrics. Resumes from history when it still reaches back to `since`,
+        otherwise falls back to a snapshot flagged with the gap.
+        """
+        if since is None and not snapshot:
+            return [], None
+
+        messages = []
+        if since is not None:
+            same_run = epoch is None or epoch == self.epoch
+            if same_run and self.oldest_seq() - 1 <= since <= self.seq:
+                replay = [
+                    (m, parsed)
+                    for seq, r, m, parsed in self.history
+                    if seq > since and client.wants(r, parsed)
+                ]
+                messages = replay + [
+                    relay_message({"replayed": len(replay), "seq": self.seq})
+                ]
+                return messages, "replay"
+            messages.append(
+                relay_message({"gap": {"since": since, "oldest": self.oldest_seq()}})
+            )
+        state = sorted(
+            (seq, message)
+            for (entry_robot, _), (seq, message) in self.latest.items()
+            if client.wants(entry_robot, message)
+        )
+        messages.append(
+            relay_message({"snapshot": [m for _, m in state], "seq": self.seq})
+        )
+        return messages, "gap" if since is not None else "snapshot"
+
+    async def handler(self, websocket):
+        # Register client
+        path = websocket.request.path
+        robot = requested_robot(path)
+        filters = requested_filters(path)
+        wire_format, batch_window = requested_wire_format(path)
+        client = RelayClient(
+            websocket,
+            self.queue_size,
+            self.overflow_policy,
+            robot,
+            filters,
+            wire_format,
+            batch_window,
+        )
+        # Catch-up is computed and the client registered without awaiting in between,
+        # so every later message lands in its queue and nothing is missed or repeated
+        catch_up, outcome = self.catch_up(client, *requested_resume(path))
+        self.add_client(client)
+        self.logger.info(
+            f"Relay client connected: {websocket.remote_address} (robot {robot or 'all'}"
+            + "".join(f", {f}={','.join(sorted(v))}" for f, v in filters.items())
+            + (f", {wire_format}" if wire_format != JSON else "")
+            + (f", batch {batch_window * 1000:g}ms" if batch_window else "")
+            + (f", {outcome} of {len(catch_up)} messages)" if outcome else ")")
+        )
+        if outcome:
+            RESUMES.inc(outcome=outcome)
+        try:
+            # The greeting is always JSON text, so a client can read what it negotiated
+            await websocket.send(
+                json.dumps(
+                    {
+                        "rs_connector": time.time(),
+                        "rs_relay": {
+                            "epoch": self.epoch,
+                            "seq": self.seq,
+                            "oldest": self.oldest_seq(),
+                            "format": wire_format,
+                            "batch": batch_window * 1000,
+                        },
+                    }
+                )
+            )
+            # Catch-up skips the bounded queue so a long replay isn't dropped by it
+            for frame in client.frames_for(catch_up):
+                await websocket.send(frame)
+            client.drain_task = asyncio.create_task(client.drain())
+            # Anything the client sends goes upstream, until it disconnects
+            async for frame in websocket:
+                error = self.receive(client, frame)
+                if error is not None:
+                    await websocket.send(json.dumps({"rs_relay": {"error": error}}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if client.drain_task:
+                client.drain_task.cancel()
+            self.remove_client(client)
+            self.logger.info(
+                f"Relay client disconnected: {websocket.remote_address} "
+                f"(sent {client.sent}, dropped {client.dropped})"
+            )
+
+    async def start(self):
+        self.registry.add_collector(self.collect_metrics)
+        self.server = await websockets.serve(
+            self.handler,
+            self.host,
+            self.port,
+            process_request=self.process_request,
+            **COMPRESSION[self.compression],
+        )
+        self.logger.info(
+            f"Relay WebSocket server started on ws://{self.host}:{self.port} "
+            f"(metrics at http://{self.host}:{self.port}/metrics)"
+        )
+
+    async def stop(self):
+        self.registry.remove_collector(self.collect_metrics)
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            self.logger.info("Relay WebSocket server stopped.")
+
+    def broadcast(self, message, received_at=None, trace=None, robot=None, parsed=None):
+        """
+        Stamp a message, record it, and hand it to the queue of every client
+        subscribed to it. Never awaits a client, so a slow consumer cannot
+        stall the caller.
+
+        received_at is the monotonic time the message arrived upstream. parsed is
+        the already decoded message, if the caller has it. trace, if given, holds
+        the parsed message plus timestamps and makes the relay attach an
+        "rs_trace" object with upstream receive and relay send times.
+        """
+        if received_at is None:
+            received_at = time.monotonic()
+        if robot is not None:
+            robot = str(robot)
+        if isinstance(message, bytes):
+            # Binary frames from upstream are usually still UTF-8 JSON, relay them as text
+            try:
+                message = message.decode()
+            except UnicodeDecodeError:
+                pass
+        if parsed is None:
+            try:
+                parsed = json.loads(message)
+            except ValueError:
+                pass
+
+        self.seq += 1
+        message = stamp(message, parsed, self.seq)
+        if isinstance(parsed, dict):
+            parsed = {**parsed, "rs_seq": self.seq}
+        self.history.append((self.seq, robot, message, parsed))
+        key = snapshot_key(parsed)
+        if key is not None:
+            self.latest[(robot, key)] = (self.seq, parsed)
+            self.latest.move_to_end((robot, key))
+            if len(self.latest) > self.snapshot_size:
+                self.latest.popitem(last=False)
+        if trace is not None:
+            trace["message"] = {**trace["message"], "rs_seq": self.seq}
+
+        if not self.clients:
+            return
+
+        self.logger.debug(
+            f"Queueing for robot {robot} ({len(self.clients)} clients). Message: {message.rstrip()}"
+        )
+        for client in self.subscribers(robot, parsed):
+            if not client.enqueue(message, received_at, trace, parsed):
+                websocket = client.websocket
+                self.logger.warning(
+                    f"Relay client {websocket.remote_address} overflowed its queue, disconnecting."
+                )
+                self.remove_client(client)
+                OVERFLOW_DISCONNECTS.inc()
+                task = asyncio.create_task(
+                    websocket.close(code=1008, reason="relay queue overflow")
+                )
+                self.closing.add(task)
+                task.add_done_callback(self.closing.discard)
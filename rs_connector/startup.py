@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+from .metrics import REGISTRY
+
+STARTUP_PHASE = REGISTRY.gauge(
+    "rs_startup_phase_seconds",
+    "How long each startup phase of a pipeline took",
+    ("robot", "phase"),
+)
+STARTUP_FIRST_BYTE = REGISTRY.gauge(
+    "rs_startup_first_byte_seconds",
+    "Time from process start to an output's first bytes reaching the ingest",
+    ("robot", "output"),
+)
+
+
+def process_age():
+    """Seconds since this process was started, from /proc where available."""
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# Monotonic time the process started, so startup numbers include interpreter boot and imports
+PROCESS_START = time.monotonic() - process_age()
+
+
+class StartupTimeline:
+    """
+    Times a pipeline's startup phases and the time from process start to the
+    first bytes of each output, exports them as metrics and logs a summary once
+    the video is up.
+    """
+
+    # Streamer outputs that carry the video viewers are waiting for
+    VIDEO_OUTPUTS = ("jsmpeg-video", "rtmp")
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.phases = {}  # phase -> seconds, in the order they finished
+        self.first_bytes = {}  # output -> seconds since process start
+        self.video_up = False
+
+        self.logger = logging.getLogger(f"Startup[{robot}]")
+
+    async def phase(self, name, awaitable):
+        """Await one startup phase and record how long it took."""
+        start = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.phases[name] = time.monotonic() - start
+            STARTUP_PHASE.set(self.phases[name], robot=self.robot, phase=name)
+
+    def first_byte(self, output):
+        """Record an output's first bytes. Only the first time per output counts."""
+        if output in self.first_bytes:
+            return
+        since_start = time.monotonic() - PROCESS_START
+        self.first_bytes[output] = since_start
+        STARTUP_FIRST_BYTE.set(since_start, robot=self.robot, output=output)
+        if output in self.VIDEO_OUTPUTS and not self.video_up:
+            self.video_up = True
+            phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+            self.logger.info(
+                f"First video bytes reached the ingest {since_start:.2f}s after process start"
+                + (f" ({phases})" if phases else "")
+            )
@@ -0,0 +1,202 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import aiohttp
+
+TS_PACKET = 188
+# Samples in one MPEG-1 Layer II audio frame
+MP2_FRAME_SAMPLES = 1152
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.cache/rs_connector/static")
+
+
+async def encode_cached(digest, cmd, cache_dir):
+    """
+    Run an ffmpeg encode once and cache its output under the digest of its inputs
+    and settings. cmd is formatted with {out}, the file to write.
+    Returns the cached path.
+    """
+    path = os.path.join(cache_dir, f"{digest.hexdigest()[:32]}.ts")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # A temp file of our own, pipelines starting together may encode the same segment
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    os.close(fd)
+    try:
+        proc = await asyncio.create_subprocess_shell(
+            cmd.format(out=tmp), stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        _, err = await proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg exited with code {proc.returncode}: {err.decode(errors='replace').strip()}"
+            )
+        # Another pipeline may have finished the same encode while we ran, keep theirs
+        if not os.path.exists(path):
+            os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+async def encode_static_segment(
+    image_path, width, height, framerate, kbps, seconds=4, cache_dir=DEFAULT_CACHE_DIR
+):
+    """
+    Encode a still image once into an MPEG-TS segment suitable for looping.
+    Segments are cached on disk by image hash and encode settings, so restarts
+    and repeated ladder changes don't re-encode anything.
+    Returns the segment path.
+    """
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(f"{width}x{height}@{framerate}:{kbps}k:{seconds}s".encode())
+    # One GOP per second so a viewer joining mid-loop gets a picture quickly
+    cmd = (
+        f"ffmpeg -y -loglevel error -loop 1 -framerate {framerate} -i {image_path} "
+        f"-frames:v {seconds * framerate} -s {width}x{height} -pix_fmt yuv420p "
+        f"-c:v mpeg1video -b:v {kbps}k -bf 0 -g {framerate} -muxdelay 0.001 "
+        f"-f mpegts {{out}}"
+    )
+    return await encode_cached(digest, cmd, cache_dir)
+
+
+async def encode_silence_segment(
+    sample_rate, channels, kbps, seconds=4, cache_dir=DEFAULT_CACHE_DIR
+):
+    """
+    Encode silence once into an MP2 MPEG-TS segment for looping, so a robot without
+    a microphone needs no audio encoder running.
+    Returns (path, duration). The segment is a whole number of audio frames and
+    duration is exact, so replaying it at wall-clock pace doesn't drift.
+    """
+    frames = max(1, round(seconds * sample_rate / MP2_FRAME_SAMPLES))
+    digest = hashlib.sha256(f"silence:{sample_rate}:{channels}:{kbps}k:{frames}".encode())
+    layout = "mono" if channels == 1 else "stereo"
+    cmd = (
+        f"ffmpeg -y -loglevel error -f lavfi "
+        f"-i anullsrc=channel_layout={layout}:sample_rate={sample_rate}:nb_samples={MP2_FRAME_SAMPLES} "
+        f"-frames:a {frames} -c:a mp2 -b:a {kbps}k -muxdelay 0.01 -f mpegts {{out}}"
+    )
+    path = await encode_cached(digest, cmd, cache_dir)
+    return path, frames * MP2_FRAME_SAMPLES / sample_rate
+
+
+class TSLoopSender:
+    """
+    Replays a pre-encoded MPEG-TS segment to a jsmpeg ingest URL at wall-clock pace.
+
+    The segment is streamed as one long chunked HTTP POST, the same way ffmpeg's
+    http output talks to the ingest, looping forever as a task. Each chunk is a slice of a
+    memoryview over the segment, so steady state costs a timer and a socket write.
+    """
+
+    def __init__(
+        self,
+        url,
+        segment_path,
+        duration,
+        stats=None,
+        on_failure=None,
+        chunk_interval=0.04,
+        min_backoff=1,
+        max_backoff=30,
+        session=None,
+    ):
+        self.url = url
+        self.duration = duration
+        with open(segment_path, "rb") as f:
+            self.data = f.read()
+        self.stats = stats
+        self.on_failure = on_failure  # awaited after a failed POST, may return a new URL
+        self.chunk_interval = chunk_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        # The pipeline's pooled session when given, otherwise one of our own
+        self.session = session
+        self.owns_session = session is None
+        self.stop_event = asyncio.Event()
+        self.task = None
+        self.sent = 0  # Bytes delivered across all connections
+
+        self.logger = logging.getLogger("TSLoopSender")
+
+    async def chunks(self):
+        data = memoryview(self.data)
+        byte_rate = len(data) / self.duration
+        # Whole TS packets, roughly chunk_interval seconds of media per write
+        size = max(TS_PACKET, int(byte_rate * self.chunk_interval) // TS_PACKET * TS_PACKET)
+        start = time.monotonic()
+        sent = 0
+        while not self.stop_event.is_set():
+            for offset in range(0, len(data), size):
+                # Wait for the wall clock to catch up with the media we've already sent
+                delay = start + sent / byte_rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.stop_event.is_set():
+                    return
+                piece = data[offset : offset + size]
+                yield piece
+                sent += len(piece)
+                self.sent += len(piece)
+                if self.stats:
+                    elapsed = time.monotonic() - start
+                    self.stats.set(
+                        total_size=self.sent,
+                        out_time=sent / byte_rate,
+                        speed=(sent / byte_rate) / elapsed if elapsed else None,
+                        bitrate_kbps=byte_rate * 8 / 1000,
+                    )
+
+    async def run(self):
+        backoff = self.min_backoff
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.logger.info(f"Streaming static loop to {self.url}")
+                async with self.session.post(self.url, data=self.chunks(), timeout=timeout):
+                    pass
+                if self.stop_event.is_set():
+                    break
+                self.logger.error(f"Ingest {self.url} closed the static stream.")
+            except Exception as e:
+                self.logger.error(f"Static stream to {self.url} failed: {e}")
+            if time.monotonic() - started > 30:
+                backoff = self.min_backoff
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), backoff)
+                break
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+            if self.on_failure:
+                try:
+                    self.url = await self.on_failure() or self.url
+                except Exception as e:
+                    self.logger.error(f"Static stream failure hook failed: {e}")
+
+    def start(self):
+        if self.owns_session:
+            self.session = aiohttp.ClientSession()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.stop_event.set()
+        if self.task:
+            # The POST may be parked on a slow ingest, don't wait for it
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.owns_session and self.session:
+            await self.session.close()
@@ -1,10 +1,78 @@
 import os
-import subprocess
+import stat
+import shlex
+import asyncio
 import logging
+from .progress import EncodeStats, OutputTail, read_progress, drain_output
+from .supervisor import ProcessSupervisor
+from .static import (
+    TSLoopSender,
+    encode_static_segment,
+    encode_silence_segment,
+    DEFAULT_CACHE_DIR,
+)
+from .metrics import REGISTRY
+
+FFMPEG_RESTARTS = REGISTRY.counter(
+    "rs_ffmpeg_restarts_total",
+    "Times ffmpeg exited and was restarted",
+    ("robot",),
+)
+FIRST_BYTE_LATENCY = REGISTRY.histogram(
+    "rs_ffmpeg_start_to_first_byte_seconds",
+    "Time from launching ffmpeg to its first output bytes",
+    ("robot", "output"),
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 30),
+)
+
+# Extra tee outputs each get their own fifo thread, so one that hangs (a blackholed
+# RTMP target, a slow disk) only backs up its own queue, which drops instead of
+# blocking the capture. The fifo retries a failed output without restarting ffmpeg.
+# fifo_options nests inside a tee slave, so its separators are escaped twice.
+EXTRA_OUTPUT_OPTIONS = (
+    r"onfail=ignore:use_fifo=1:fifo_options=drop_pkts_on_overflow=1\\\:attempt_recovery=1"
+)
+# I/O timeout for backup RTMP targets, in microseconds
+RTMP_RW_TIMEOUT = 5_000_000
+
+# Bytes of ffmpeg's log kept for the crash report
+OUTPUT_TAIL_BYTES = 16 * 1024
+# Length of the pre-encoded static image loop
+STATIC_SEGMENT_SECONDS = 4
+
+# Video encoders for outputs sharing one ffmpeg, by codec. {i} is the output stream
+# the encode is mapped to, {bitrate} its -b:v option (empty to leave it to ffmpeg).
+VIDEO_ENCODERS = {
+    "mpeg1video": "-c:v:{i} mpeg1video {bitrate} -bf:v:{i} 0",
+    # Global headers so the flv/segment muxers behind tee get SPS/PPS, and a keyframe
+    # every 2s so viewers can join and recordings can be cut
+    "h264": "-c:v:{i} libx264 -preset:v:{i} veryfast -tune:v:{i} zerolatency {bitrate} "
+    "-force_key_frames:v:{i} 'expr:gte(t,n_forced*2)' -flags:v:{i} +global_header",
+}
 
 
 class Streamer:
-    def __init__(self, video_device, robot_id, stream_key, ffmpeg_opts=None):
+    def __init__(
+        self,
+        video_device,
+        robot_id,
+        stream_key,
+        ffmpeg_opts=None,
+        max_crashes=5,
+        crash_window=120,
+        static_loop=True,
+        static_cache_dir=DEFAULT_CACHE_DIR,
+        frame_source=None,
+        rtmp_outputs=None,
+        record_dir=None,
+        record_segment_seconds=60,
+        record_segments=60,
+        record_codec="mpeg1video",
+        video_enabled=True,
+        audio_enabled=True,
+        audio_device=None,
+        audio_input_format="alsa",
+    ):
         self.video_device = video_device
         self.robot_id = robot_id
         self.stream_key = stream_key
@@ -13,28 +81,218 @@ class Streamer:
             f"rtmp://rtmp.robotstreamer.com/live/{self.robot_id}?key={self.stream_key}"
         )
         self.proc = None
-        self.logger = logging.getLogger("Streamer")
+        self.logger = logging.getLogger(f"Streamer[{robot_id}]")
         self.video_proc = None
         self.audio_proc = None
-        self.monitor_thread = None
+        # Optional coroutine function(*kinds) returning fresh (video_endpoint, audio_endpoint)
+        # after a crash, None for the kinds it wasn't asked for
+        self.on_ffmpeg_exit = None
+        self.jsmpeg_args = {}
+        self.rtmp_args = {}
+        # Supervisor settings and the running supervisors. Video and audio run as
+        # separate processes, so either can crash or be restarted without the other.
+        self.max_crashes = max_crashes
+        self.crash_window = crash_window
+        self.supervisor = None
+        self.audio_supervisor = None
+        self.video_enabled = video_enabled
+        self.audio_enabled = audio_enabled
+        # Microphone to capture (e.g. hw:1,0), silence is sent without one
+        self.audio_device = audio_device
+        self.audio_input_format = audio_input_format
+        # Set by stop_stream(), and swapped also whenever a supervisor is replaced
+        self.stopped = asyncio.Event()
+        self.swapped = asyncio.Event()
+        # Static images are encoded once and replayed instead of re-encoded forever
+        self.static_loop = static_loop
+        self.static_cache_dir = static_cache_dir
+        self.static_sender = None
+        self.audio_sender = None  # Pre-encoded silence when there's no microphone
+        # Pooled aiohttp session the loop senders post with, set by the pipeline
+        self.http_session = None
+        # Optional FrameSource feeding raw frames from Python instead of video_device
+        self.frame_source = frame_source
+        # Extra outputs fed from the same capture: backup RTMP targets and a rolling recording
+        self.rtmp_outputs = list(rtmp_outputs or [])
+        self.record_dir = record_dir
+        self.record_segment_seconds = record_segment_seconds
+        self.record_segments = record_segments
+        if record_codec not in VIDEO_ENCODERS:
+            raise ValueError(f"Unknown recording codec: {record_codec}")
+        self.record_codec = record_codec
+        self.feed_task = None
+        # Background tasks reading ffmpeg's stdout/stderr
+        self.readers = set()
+        # Live encoder stats per output, keyed by output label
+        self.stats = {}
+        # Optional callable(label), called whenever an output delivers its first bytes
+        self.on_first_byte = None
 
-    def start_stream(self):
-        # If it's a video device (e.g., /dev/video0)
+    def set_frame_source(self, frame_source):
+        """Feed video from a FrameSource; takes effect on the next (re)start of ffmpeg."""
+        if frame_source is not None:
+            frame_source.robot = self.robot_id
+        self.frame_source = frame_source
+
+    def video_source(self):
+        """
+        Where video comes from: 'frames' for a Python FrameSource, 'v4l2' for /dev/video*,
+        'rawvideo' for a FIFO of raw RGB24 frames (e.g. from the reflector), otherwise 'image'.
+        """
+        if self.frame_source is not None:
+            return "frames"
         if self.video_device.startswith("/dev/video"):
+            return "v4l2"
+        try:
+            if stat.S_ISFIFO(os.stat(self.video_device).st_mode):
+                return "rawvideo"
+        except OSError:
+            pass
+        return "image"
+
+    async def supervise(self, name, spawn, on_crash=None, audio=False):
+        """Run spawn() as the video (or audio) process under a ProcessSupervisor until stop_stream()."""
+        current = self.audio_supervisor if audio else self.supervisor
+        if current:
+            await current.stop()
+
+        async def crashed():
+            FFMPEG_RESTARTS.inc(robot=self.robot_id)
+            if on_crash:
+                await on_crash()
+
+        supervisor = ProcessSupervisor(
+            name,
+            spawn,
+            on_crash=crashed,
+            on_terminate=None if audio else self.stop_feed,
+            diagnostics=self.exit_diagnostics,
+            max_crashes=self.max_crashes,
+            crash_window=self.crash_window,
+            # There's no trailer worth waiting for on a live pipe
+            stop_timeout=1 if self.frame_source and not audio else 5,
+            robot=self.robot_id,
+        )
+        if audio:
+            self.audio_supervisor = supervisor
+        else:
+            self.supervisor = supervisor
+        self.swapped.set()
+        supervisor.start()
+
+    async def start_stream(self, xres=768, yres=432, framerate=25):
+        # The size and rate are only needed for a raw frame FIFO, which carries neither
+        self.rtmp_args = dict(xres=xres, yres=yres, framerate=framerate)
+        self.stopped.clear()
+        REGISTRY.add_collector(self.collect_metrics)
+        await self.supervise("ffmpeg-rtmp", self.spawn_rtmp)
+
+    def extra_outputs(self):
+        """
+        (codec, tee slave options, target) for the optional outputs. They are all
+        isolated (see EXTRA_OUTPUT_OPTIONS), so a dead or hung backup target or a full
+        disk never stops the main stream.
+        """
+        outputs = [
+            ("h264", f"f=flv:rw_timeout={RTMP_RW_TIMEOUT}", url) for url in self.rtmp_outputs
+        ]
+        if self.record_dir:
+            # segment_wrap reuses the same file names, bounding the recording on disk
+            n = self.record_segments
+            playlist = os.path.join(self.record_dir, "rec.m3u8")
+            outputs.append(
+                (
+                    self.record_codec,
+                    f"f=segment:segment_format=mpegts:segment_time={self.record_segment_seconds}:"
+                    f"segment_wrap={n}:reset_timestamps=1:segment_list={playlist}:"
+                    f"segment_list_size={n}:segment_list_flags=live",
+                    os.path.join(self.record_dir, f"rec-%0{len(str(n - 1))}d.ts"),
+                )
+            )
+        return outputs
+
+    def tee_video_output(self, main, kbps=None, scale_option=""):
+        """
+        ffmpeg output args that feed the main output and every extra output from one
+        capture with the tee muxer. main is (codec, tee slave options, target).
+        Each codec is encoded once and shared by every output that wants it.
+        """
+        outputs = [main] + self.extra_outputs()
+        codecs = list(dict.fromkeys(codec for codec, _, _ in outputs))
+        encoders = " ".join(
+            VIDEO_ENCODERS[codec].format(i=i, bitrate=f"-b:v:{i} {kbps}k" if kbps else "")
+            for i, codec in enumerate(codecs)
+        )
+        slaves = "|".join(
+            f"[{options}:select={codecs.index(codec)}{':' + EXTRA_OUTPUT_OPTIONS if n else ''}]{target}"
+            for n, (codec, options, target) in enumerate(outputs)
+        )
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+        maps = " ".join("-map 0:v" for _ in codecs)
+        return f"{maps} {scale_option} {encoders} -f tee {shlex.quote(slaves)}"
+
+    def rawvideo_input(self, xres, yres, framerate):
+        # Frames pushed by another process over a pipe, sized to VIDEO_XRES x VIDEO_YRES
+        return (
+            f"-f rawvideo -pix_fmt rgb24 -video_size {xres}x{yres} -framerate {framerate} "
+            f"-i {self.video_device}"
+        )
+
+    async def spawn_rtmp(self):
+        # If it's a video device (e.g., /dev/video0)
+        source = self.video_source()
+        if source == "v4l2":
             input_arg = f"-f v4l2 -i {self.video_device}"
+        elif source == "rawvideo":
+            args = self.rtmp_args
+            input_arg = self.rawvideo_input(args["xres"], args["yres"], args["framerate"])
+        elif source == "frames":
+            input_arg = self.frame_source.input_args()
         else:
             # Static image: loop the image as video
             input_arg = f"-loop 1 -framerate 2 -i {self.video_device}"
+        if self.extra_outputs():
+            output = self.tee_video_output(("h264", "f=flv", self.rtmp_url))
+        else:
+            output = f"-c:v libx264 -f flv {self.rtmp_url}"
         cmd = (
-            f"ffmpeg {input_arg} {self.ffmpeg_opts} -c:v libx264 -f flv {self.rtmp_url}"
+            f"ffmpeg -hide_banner -nostats -progress pipe:1 {input_arg} {self.ffmpeg_opts} "
+            f"{output}"
         )
         self.logger.info(f"Starting ffmpeg: {cmd}")
-        self.proc = subprocess.Popen(
-            cmd,
-            shell=True,
-        )
+        self.proc = await self.popen_ffmpeg(cmd, stdin=source == "frames")
+        self.track_progress(self.proc, "rtmp")
+        if source == "frames":
+            self.feed_frames(self.proc)
+        return self.proc
+
+    def track_progress(self, proc, label):
+        """Feed the ffmpeg process' -progress output on stdout into self.stats[label]."""
+        stats = self.new_stats(label)
+        self.spawn_reader(read_progress(proc.stdout, stats))
+        return stats
+
+    def spawn_reader(self, coro):
+        # Keep a reference so the task isn't garbage collected mid-read
+        task = asyncio.create_task(coro)
+        self.readers.add(task)
+        task.add_done_callback(self.readers.discard)
+
+    def new_stats(self, label):
+        """Fresh EncodeStats for an output, replacing the last run's."""
+        stats = EncodeStats(label)
+        stats.on_first_byte = lambda latency: self.first_byte(label, latency)
+        self.stats[label] = stats
+        return stats
 
-    def start_jsmpeg_stream(
+    def first_byte(self, label, latency):
+        FIRST_BYTE_LATENCY.observe(latency, robot=self.robot_id, output=label)
+        self.logger.info(f"ffmpeg {label} delivered its first bytes {latency:.2f}s after launch")
+        if self.on_first_byte:
+            self.on_first_byte(label)
+
+    async def start_jsmpeg_stream(
         self,
         video_endpoint,
         xres=768,
@@ -46,90 +304,397 @@ class Streamer:
         audio_sample_rate=32000,
         audio_channels=1,
         audio_kbps=64,
+        output_size=None,
     ):
         """
-        Start ffmpeg for robot jsmpeg video and audio streaming using the provided endpoints.
+        Start the robot jsmpeg video and audio streams using the provided endpoints.
+        Each runs on its own, so a failing audio ingest never restarts the camera.
         video_endpoint: dict with 'host' and 'port'
         audio_endpoint: dict with 'host' and 'port'
+        output_size: optional (width, height) to scale to, defaults to the capture size
+        """
+        # Remember the settings so restarts (crash or ladder change) can reuse them
+        self.jsmpeg_args = dict(
+            video_endpoint=video_endpoint,
+            xres=xres,
+            yres=yres,
+            framerate=framerate,
+            kbps=kbps,
+            rotation_option=rotation_option,
+            audio_endpoint=audio_endpoint,
+            audio_sample_rate=audio_sample_rate,
+            audio_channels=audio_channels,
+            audio_kbps=audio_kbps,
+            output_size=output_size,
+        )
+        self.stopped.clear()
+        REGISTRY.add_collector(self.collect_metrics)
+        if self.video_enabled:
+            await self.start_video()
+        if self.audio_enabled:
+            await self.start_audio()
+
+    async def start_video(self):
+        if self.use_static_loop() and await self.start_static_video():
+            return
+        await self.supervise(
+            "ffmpeg-jsmpeg-video",
+            self.spawn_jsmpeg,
+            on_crash=lambda: self.refresh_endpoints("video"),
+        )
+
+    async def start_audio(self):
+        # Silence doesn't need an encoder running, only a microphone does
+        if not self.audio_device and await self.start_silence():
+            return
+        await self.supervise(
+            "ffmpeg-jsmpeg-audio",
+            self.spawn_jsmpeg_audio,
+            on_crash=lambda: self.refresh_endpoints("audio"),
+            audio=True,
+        )
+
+    async def refresh_endpoints(self, *kinds):
+        if not self.on_ffmpeg_exit:
+            return
+        new_video, new_audio = await self.on_ffmpeg_exit(*kinds)
+        if new_video:
+            self.jsmpeg_args["video_endpoint"] = new_video
+        if new_audio:
+            self.jsmpeg_args["audio_endpoint"] = new_audio
+
+    def jsmpeg_urls(self):
+        """
+        Ingest URLs for the current jsmpeg settings: (video_url, audio_url).
+        Audio falls back to the video URL, video is None without an endpoint.
         """
-        import threading
-        import time
+        args = self.jsmpeg_args
+        video_endpoint, audio_endpoint = args["video_endpoint"], args["audio_endpoint"]
+        out_x, out_y = args["output_size"] or (args["xres"], args["yres"])
 
-        vhost = video_endpoint["host"]
-        vport = video_endpoint["port"]
-        video_url = f"http://{vhost}:{vport}/{self.stream_key}/{xres}/{yres}/"
+        video_url = None
+        if video_endpoint:
+            vhost = video_endpoint["host"]
+            vport = video_endpoint["port"]
+            video_url = f"http://{vhost}:{vport}/{self.stream_key}/{out_x}/{out_y}/"
         if audio_endpoint:
             ahost = audio_endpoint["host"]
             aport = audio_endpoint["port"]
             audio_url = f"http://{ahost}:{aport}/{self.stream_key}/640/480/"
         else:
             audio_url = video_url  # fallback
+        return video_url, audio_url
 
-        if self.video_device.startswith("/dev/video"):
-            video_input = f"-f v4l2 -framerate {framerate} -video_size {xres}x{yres} -r {framerate} -i {self.video_device} {rotation_option}"
+    def audio_input(self):
+        args = self.jsmpeg_args
+        channels, sample_rate = args["audio_channels"], args["audio_sample_rate"]
+        if self.audio_device:
+            return (
+                f"-f {self.audio_input_format} -ac {channels} -ar {sample_rate} "
+                f"-i {self.audio_device}"
+            )
+        # Without a capture device to pace it, lavfi has to be held to real time with -re
+        layout = "mono" if channels == 1 else "stereo"
+        return f"-re -f lavfi -i anullsrc=channel_layout={layout}:sample_rate={sample_rate}"
+
+    async def spawn_jsmpeg(self):
+        args = self.jsmpeg_args
+        xres, yres, framerate = args["xres"], args["yres"], args["framerate"]
+        scale_option = "-s %dx%d" % args["output_size"] if args["output_size"] else ""
+        video_url, _ = self.jsmpeg_urls()
+
+        source = self.video_source()
+        if source == "v4l2":
+            video_input = f"-f v4l2 -framerate {framerate} -video_size {xres}x{yres} -r {framerate} -i {self.video_device} {args['rotation_option']}"
+        elif source == "rawvideo":
+            video_input = self.rawvideo_input(xres, yres, framerate)
+        elif source == "frames":
+            video_input = self.frame_source.input_args()
         else:
             video_input = f"-loop 1 -framerate {framerate} -video_size {xres}x{yres} -i {self.video_device}"
-        audio_input = f"-f lavfi -ac {audio_channels} -i anullsrc=channel_layout=mono:sample_rate={audio_sample_rate}"
 
-        # Use -map to send video to video_url and audio to audio_url
+        if self.extra_outputs():
+            # jsmpeg stays the one output whose failure restarts ffmpeg
+            video_output = self.tee_video_output(
+                ("mpeg1video", "f=mpegts:max_delay=1000", video_url),
+                args["kbps"],
+                scale_option,
+            )
+        else:
+            video_output = f"-map 0:v {scale_option} -c:v mpeg1video -b:v {args['kbps']}k -bf 0 -muxdelay 0.001 -f mpegts {video_url}"
+
+        # Machine-readable progress goes to stdout, ffmpeg's log to stderr
+        cmd = f"ffmpeg -hide_banner -nostats -progress pipe:1 {video_input} {video_output}"
+        self.logger.info(f"Starting ffmpeg (jsmpeg video): {cmd}")
+        proc = await self.popen_ffmpeg(cmd, stdin=source == "frames")
+        if source == "frames":
+            self.feed_frames(proc)
+        self.track_progress(proc, "jsmpeg-video")
+        self.video_proc = proc
+        return proc
+
+    async def spawn_jsmpeg_audio(self):
+        args = self.jsmpeg_args
+        _, audio_url = self.jsmpeg_urls()
         cmd = (
-            f"ffmpeg {video_input} {audio_input} "
-            f"-map 0:v -c:v mpeg1video -b:v {kbps}k -bf 0 -muxdelay 0.001 -f mpegts {video_url} "
-            f"-map 1:a -c:a mp2 -b:a {audio_kbps}k -muxdelay 0.01 -f mpegts {audio_url}"
+            f"ffmpeg -hide_banner -nostats -progress pipe:1 {self.audio_input()} "
+            f"-map 0:a -c:a mp2 -ac {args['audio_channels']} -ar {args['audio_sample_rate']} "
+            f"-b:a {args['audio_kbps']}k -muxdelay 0.01 -f mpegts {audio_url}"
         )
-        self.logger.info(f"Starting ffmpeg (jsmpeg video+audio): {cmd}")
-        proc = subprocess.Popen(
-            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        self.logger.info(f"Starting ffmpeg (jsmpeg audio): {cmd}")
+        proc = await self.popen_ffmpeg(cmd)
+        self.track_progress(proc, "jsmpeg-audio")
+        self.audio_proc = proc
+        return proc
+
+    async def popen_ffmpeg(self, cmd, stdin=False):
+        # exec so terminate() reaches ffmpeg itself rather than the wrapping shell
+        proc = await asyncio.create_subprocess_shell(
+            f"exec {cmd}",
+            stdin=asyncio.subprocess.PIPE if stdin else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
         )
 
-        def log_ffmpeg_output():
-            if self.logger.isEnabledFor(logging.DEBUG):
-                for line in proc.stdout:
-                    self.logger.debug(f"[ffmpeg] {line.strip()}")
-            else:
-                for _ in proc.stdout:
-                    pass
+        # Keep only the tail of ffmpeg's log for crash reports, decode it only to debug
+        def log_chunk(chunk):
+            self.logger.debug(f"[ffmpeg] {chunk.decode(errors='replace').rstrip()}")
 
-        threading.Thread(target=log_ffmpeg_output, daemon=True).start()
-        self.video_proc = proc
-        self.audio_proc = proc
+        proc.output_tail = OutputTail(OUTPUT_TAIL_BYTES)
+        proc.output_drain = asyncio.create_task(
+            drain_output(
+                proc.stderr,
+                proc.output_tail,
+                log_chunk if self.logger.isEnabledFor(logging.DEBUG) else None,
+            )
+        )
+        return proc
+
+    async def exit_diagnostics(self, proc):
+        """Crash report fields for a failed ffmpeg: the tail of its log."""
+        tail = getattr(proc, "output_tail", None)
+        if tail is None:
+            return {}
+        # ffmpeg's last words may still be in the pipe
+        try:
+            await asyncio.wait_for(asyncio.shield(proc.output_drain), 1)
+        except asyncio.TimeoutError:
+            pass
+        return {"robot": self.robot_id, "output_tail": tail.text()}
+
+    def feed_frames(self, proc):
+        """Pump the frame source into this ffmpeg's stdin until it exits or stop_feed()."""
+
+        async def feed():
+            try:
+                await self.frame_source.feed(proc.stdin)
+            finally:
+                # EOF lets ffmpeg finish; it won't act on SIGTERM while waiting for input
+                proc.stdin.close()
+
+        self.feed_task = asyncio.create_task(feed())
+
+    def stop_feed(self):
+        if self.feed_task:
+            self.feed_task.cancel()
+
+    def use_static_loop(self):
+        # Extra outputs need a live encode, so ffmpeg handles the image itself then
+        return self.static_loop and self.video_source() == "image" and not self.extra_outputs()
+
+    async def static_segment(self, out_x, out_y, framerate, kbps):
+        """Path of the pre-encoded loop for the static image, encoding it if it isn't cached."""
+        return await encode_static_segment(
+            self.video_device,
+            out_x,
+            out_y,
+            framerate,
+            kbps,
+            seconds=STATIC_SEGMENT_SECONDS,
+            cache_dir=self.static_cache_dir,
+        )
+
+    async def warm_up(self, xres, yres, framerate, kbps, output_size=None):
+        """
+        Do the slow parts of starting a jsmpeg stream that don't need the ingest
+        endpoints yet, so they can overlap with endpoint discovery.
+        """
+        if not (self.video_enabled and self.use_static_loop()):
+            return
+        out_x, out_y = output_size or (xres, yres)
+        try:
+            await self.static_segment(out_x, out_y, framerate, kbps)
+        except Exception as e:
+            # start_static_video() tries again and falls back to live ffmpeg
+            self.logger.warning(f"Could not pre-encode {self.video_device} during warm-up: {e}")
+
+    async def start_static_video(self):
+        """
+        Stream the static image from a cached pre-encoded MPEG-TS loop.
+        Returns False (and leaves ffmpeg to do it) if the segment can't be built.
+        """
+        args = self.jsmpeg_args
+        out_x, out_y = args["output_size"] or (args["xres"], args["yres"])
+        seconds = STATIC_SEGMENT_SECONDS
+        try:
+            segment = await self.static_segment(out_x, out_y, args["framerate"], args["kbps"])
+        except Exception as e:
+            self.logger.error(f"Could not pre-encode {self.video_device}, using live ffmpeg: {e}")
+            return False
+
+        async def failed():
+            await self.refresh_endpoints("video")
+            return self.jsmpeg_urls()[0]
+
+        stats = self.new_stats("jsmpeg-video")
+        video_url, _ = self.jsmpeg_urls()
+        self.logger.info(f"Replaying pre-encoded {segment} to {video_url}")
+        self.static_sender = TSLoopSender(
+            video_url,
+            segment,
+            seconds,
+            stats=stats,
+            on_failure=failed,
+            session=self.http_session,
+        )
+        self.static_sender.start()
+        return True
+
+    async def start_silence(self):
+        """
+        Stream silence from a cached pre-encoded MP2 loop.
+        Returns False (and leaves ffmpeg to do it) if the segment can't be built.
+        """
+        args = self.jsmpeg_args
+        try:
+            segment, seconds = await encode_silence_segment(
+                args["audio_sample_rate"],
+                args["audio_channels"],
+                args["audio_kbps"],
+                seconds=STATIC_SEGMENT_SECONDS,
+                cache_dir=self.static_cache_dir,
+            )
+        except Exception as e:
+            self.logger.error(f"Could not pre-encode silence, using live ffmpeg: {e}")
+            return False
 
-        # Monitor just this one process
-        def monitor():
-            while True:
-                ret = proc.poll()
-                if ret is not None:
-                    self.logger.error(
-                        f"ffmpeg process exited with code {ret}! Restarting..."
-                    )
-                    proc.terminate()
-                    proc.wait()
-                    time.sleep(2)
-                    # Restart
-                    self.start_jsmpeg_stream(
-                        video_endpoint,
-                        xres=xres,
-                        yres=yres,
-                        framerate=framerate,
-                        kbps=kbps,
-                        rotation_option=rotation_option,
-                        audio_endpoint=audio_endpoint,
-                        audio_sample_rate=audio_sample_rate,
-                        audio_channels=audio_channels,
-                        audio_kbps=audio_kbps,
-                    )
-                    break
-                time.sleep(1)
-
-        self.monitor_thread = threading.Thread(target=monitor, daemon=True)
-        self.monitor_thread.start()
-
-    def stop_stream(self):
-        if self.proc:
-            self.proc.terminate()
-            self.proc.wait()
+        async def failed():
+            await self.refresh_endpoints("audio")
+            return self.jsmpeg_urls()[1]
+
+        stats = self.new_stats("jsmpeg-audio")
+        _, audio_url = self.jsmpeg_urls()
+        self.logger.info(f"Replaying pre-encoded silence {segment} to {audio_url}")
+        self.audio_sender = TSLoopSender(
+            audio_url,
+            segment,
+            seconds,
+            stats=stats,
+            on_failure=failed,
+            session=self.http_session,
+        )
+        self.audio_sender.start()
+        return True
+
+    async def restart_jsmpeg_stream(self, **changes):
+        """Restart the jsmpeg video with some settings changed (e.g. kbps). Audio keeps running."""
+        self.jsmpeg_args.update(changes)
+        if self.static_sender:
+            await self.static_sender.stop()
+            self.static_sender = None
+            await self.start_video()
+        elif self.supervisor:
+            await self.supervisor.restart()
+
+    async def stop_stream(self):
+        self.stopped.set()
+        self.swapped.set()
+        # A stopped streamer's stats are stale, stop exporting them
+        REGISTRY.remove_collector(self.collect_metrics)
+        # Swap out first, stop_stream() may be called again while we await
+        senders = (self.static_sender, self.audio_sender)
+        supervisors = [s for s in (self.supervisor, self.audio_supervisor) if s]
+        self.static_sender = self.audio_sender = None
+        self.supervisor = self.audio_supervisor = None
+        for sender in senders:
+            if sender:
+                await sender.stop()
+        if supervisors:
+            await asyncio.gather(*(supervisor.stop() for supervisor in supervisors))
             self.logger.info("Stopped ffmpeg process.")
 
+    def video_running(self):
+        """Whether anything is producing the jsmpeg video right now."""
+        return bool(self.static_sender or (self.supervisor and self.supervisor.running))
+
+    def main_supervisor(self):
+        """The supervisor whose crash loop ends the stream: video's, or audio's without video."""
+        return self.supervisor if self.video_enabled else self.audio_supervisor
+
+    async def wait(self):
+        """Wait until the stream stops or its main supervisor gives up on a crash loop."""
+        while not self.stopped.is_set():
+            self.swapped.clear()
+            supervisor = self.main_supervisor()
+            if supervisor is None:
+                # Pre-encoded loops need no supervisor, wait until one appears or we stop
+                await self.swapped.wait()
+                continue
+            await supervisor.wait()
+            # A restart may swap in a new supervisor, follow it
+            if self.main_supervisor() is supervisor:
+                break
+
+    @property
+    def failed(self):
+        supervisor = self.main_supervisor()
+        return bool(supervisor and supervisor.failed)
+
+    def get_stats(self):
+        """Snapshot of the live encoder stats for every output."""
+        return {label: stats.as_dict() for label, stats in self.stats.items()}
+
+    def collect_metrics(self):
+        for label, stats in list(self.stats.items()):
+            labels = {"robot": self.robot_id, "output": label}
+            yield "rs_ffmpeg_fps", "gauge", "Encoder frames per second", labels, stats.fps
+            yield (
+                "rs_ffmpeg_bitrate_kbps",
+                "gauge",
+                "Encoder output bitrate in kbit/s",
+                labels,
+                stats.bitrate_kbps,
+            )
+            yield (
+                "rs_ffmpeg_speed",
+                "gauge",
+                "Encode speed relative to real time",
+                labels,
+                stats.speed,
+            )
+            yield (
+                "rs_ffmpeg_dropped_frames",
+                "gauge",
+                "Frames dropped by the encoder since it started",
+                labels,
+                stats.drop_frames,
+            )
+            yield (
+                "rs_ffmpeg_duplicated_frames",
+                "gauge",
+                "Frames duplicated by the encoder since it started",
+                labels,
+                stats.dup_frames,
+            )
+            yield (
+                "rs_ffmpeg_output_bytes",
+                "gauge",
+                "Bytes written to the output since ffmpeg started",
+                labels,
+                stats.total_size,
+            )
+
     def get_bitrate(self):
-        # Stub: In a real implementation, parse ffmpeg logs or use ffprobe
-        return None
+        # Total output bitrate in kbit/s across outputs, None until ffmpeg reports it
+        rates = [s.bitrate_kbps for s in self.stats.values() if s.bitrate_kbps]
+        return sum(rates) if rates else None
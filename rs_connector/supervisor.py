@@ -0,0 +1,197 @@
+import time
+import json
+import asyncio
+import logging
+from .metrics import REGISTRY
+
+SUPERVISOR_RESTARTS = REGISTRY.counter(
+    "rs_supervisor_restarts_total",
+    "Supervised process restarts",
+    ("robot", "process", "reason"),
+)
+SUPERVISOR_FAILED = REGISTRY.gauge(
+    "rs_supervisor_failed",
+    "1 once a supervised process has been given up on after a crash loop",
+    ("robot", "process"),
+)
+
+
+class ProcessSupervisor:
+    """
+    Keeps one child process running.
+
+    A task awaits the child's exit, so an exit is noticed the moment it happens
+    rather than on the next poll. Crashes are restarted with
+    exponential backoff. A run that lasts `healthy_after` seconds resets the
+    backoff. `max_crashes` exits within `crash_window` seconds count as a crash
+    loop, and the supervisor gives up.
+    """
+
+    def __init__(
+        self,
+        name,
+        spawn,
+        on_crash=None,
+        on_terminate=None,
+        diagnostics=None,
+        min_backoff=1,
+        max_backoff=30,
+        healthy_after=30,
+        max_crashes=5,
+        crash_window=120,
+        stop_timeout=5,
+        robot="",
+    ):
+        self.name = name
+        self.robot = robot  # Robot ID for the metric labels
+        self.spawn = spawn  # coroutine function returning a started asyncio Process
+        self.on_crash = on_crash  # awaited after a crash, before the restart
+        self.on_terminate = on_terminate  # called right after SIGTERM to a running child
+        self.diagnostics = diagnostics  # awaited with a failed child, returns extra report fields
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.healthy_after = healthy_after
+        self.max_crashes = max_crashes
+        self.crash_window = crash_window
+        self.stop_timeout = stop_timeout  # grace period after SIGTERM before SIGKILL
+
+        self.proc = None
+        self.started_at = None
+        self.crash_times = []
+        self.backoff = min_backoff
+        self.failed = False
+        self.restart_requested = False
+        self.stop_event = asyncio.Event()
+        self.task = None
+
+        self.logger = logging.getLogger(f"Supervisor[{name}]")
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while not self.stop_event.is_set():
+            # Set before spawning, so a spawn that fails at once never counts as a long run
+            self.started_at = time.monotonic()
+            self.proc = None
+            try:
+                self.proc = await self.spawn()
+            except Exception as e:
+                self.logger.error(f"Could not start {self.name}: {e}")
+                ret = None
+            else:
+                if self.stop_event.is_set():
+                    # stop() came in while we were spawning
+                    await self.terminate()
+                    break
+                ret = await self.proc.wait()
+            if self.stop_event.is_set():
+                break
+
+            if self.restart_requested:
+                self.restart_requested = False
+                SUPERVISOR_RESTARTS.inc(robot=self.robot, process=self.name, reason="requested")
+                continue
+
+            now = time.monotonic()
+            if ret is not None:
+                await self.report_exit(ret, now)
+            if now - self.started_at >= self.healthy_after:
+                self.backoff = self.min_backoff
+            self.crash_times = [
+                t for t in self.crash_times if now - t < self.crash_window
+            ] + [now]
+            if len(self.crash_times) >= self.max_crashes:
+                self.logger.error(
+                    f"{self.name} exited {len(self.crash_times)} times in "
+                    f"{self.crash_window}s, giving up (crash loop)."
+                )
+                self.failed = True
+                SUPERVISOR_FAILED.set(1, robot=self.robot, process=self.name)
+                break
+
+            outcome = "could not be started" if ret is None else f"exited with code {ret}"
+            self.logger.error(f"{self.name} {outcome}, restarting in {self.backoff:.0f}s...")
+            SUPERVISOR_RESTARTS.inc(robot=self.robot, process=self.name, reason="crash")
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), self.backoff)
+                break
+            except asyncio.TimeoutError:
+                pass
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            if self.on_crash:
+                try:
+                    await self.on_crash()
+                except Exception as e:
+                    self.logger.error(f"Crash hook for {self.name} failed: {e}")
+
+    async def report_exit(self, ret, now):
+        """
+        Log an unexpected exit as one structured event, with whatever diagnostics we
+        have. A clean exit (code 0) is still unexpected for a long-running child.
+        """
+        event = {
+            "event": "process_exit",
+            "process": self.name,
+            "exit_code": ret,
+            "uptime": round(now - self.started_at, 3),
+        }
+        if self.diagnostics:
+            try:
+                event.update(await self.diagnostics(self.proc))
+            except Exception as e:
+                self.logger.warning(f"Could not collect diagnostics for {self.name}: {e}")
+        if ret == 0:
+            self.logger.warning(
+                f"{self.name} exited cleanly: {json.dumps(event)}", extra={"rs_event": event}
+            )
+        else:
+            self.logger.error(
+                f"{self.name} failed: {json.dumps(event)}", extra={"rs_event": event}
+            )
+
+    async def restart(self):
+        """
+        Restart the child now, without counting it as a crash. Without a running
+        child (spawning, or backing off after a crash) the next spawn is soon anyway,
+        and a flag left set would make its later crash look requested.
+        """
+        if not self.running:
+            return
+        self.restart_requested = True
+        await self.terminate()
+
+    async def terminate(self, timeout=None):
+        timeout = self.stop_timeout if timeout is None else timeout
+        proc = self.proc
+        if proc and proc.returncode is None:
+            try:
+                proc.terminate()
+            except ProcessLookupError:
+                return
+            if self.on_terminate:
+                self.on_terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(f"{self.name} did not exit, killing it.")
+                proc.kill()
+                await proc.wait()
+
+    async def stop(self, timeout=None):
+        self.stop_event.set()
+        await self.terminate(timeout)
+        if self.task and self.task is not asyncio.current_task():
+            try:
+                await asyncio.wait_for(self.task, self.stop_timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait(self):
+        """Wait until the supervisor stops or gives up."""
+        if self.task:
+            await asyncio.shield(self.task)
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import itertools
+import collections
+from .metrics import REGISTRY
+
+# Priorities for messages sent up the control WebSocket
+CONTROL = "control"  # Keepalives, always sent first and never rate limited
+BULK = "bulk"  # Everything relay clients send, rate limited and coalesced
+
+UPSTREAM_SENT = REGISTRY.counter(
+    "rs_upstream_sent_total",
+    "Messages sent on the upstream control WebSocket, by priority",
+    ("robot", "priority"),
+)
+UPSTREAM_DROPPED = REGISTRY.counter(
+    "rs_upstream_dropped_total",
+    "Bulk upstream messages dropped because the send queue was full",
+    ("robot",),
+)
+UPSTREAM_COALESCED = REGISTRY.counter(
+    "rs_upstream_coalesced_total",
+    "Bulk upstream messages replaced by a newer one with the same coalesce key",
+    ("robot",),
+)
+
+
+class UpstreamQueue:
+    """
+    The single outbound queue for a robot's control WebSocket.
+
+    Control messages (RS_PING) always go out first. Bulk messages from relay
+    clients go out in arrival order through a token bucket of `rate` messages
+    per second with bursts of up to `burst`. At most `max_pending` wait, and
+    the oldest is dropped past that. A bulk message with a coalesce key replaces
+    the one still waiting under that key and keeps its place in line, so a
+    stream of telemetry only ever sends the latest value.
+    """
+
+    def __init__(self, robot, rate=10, burst=20, max_pending=100):
+        self.robot = robot
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+
+        self.control = collections.deque()
+        self.bulk = collections.OrderedDict()  # coalesce key -> message, oldest first
+        self.unkeyed = itertools.count()  # Unique keys for messages that don't coalesce
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.wakeup = asyncio.Event()
+
+    def put(self, message, priority=BULK, key=None):
+        """Queue a message without blocking."""
+        if priority == CONTROL:
+            self.control.append(message)
+        elif key is not None and key in self.bulk:
+            self.bulk[key] = message
+            UPSTREAM_COALESCED.inc(robot=self.robot)
+        else:
+            if len(self.bulk) >= self.max_pending:
+                self.bulk.popitem(last=False)
+                UPSTREAM_DROPPED.inc(robot=self.robot)
+            self.bulk[(None, next(self.unkeyed)) if key is None else key] = message
+        self.wakeup.set()
+
+    def clear_control(self):
+        """Forget keepalives meant for a session that has ended."""
+        self.control.clear()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def get(self):
+        """Wait for the next message that may be sent. Returns (message, priority)."""
+        while True:
+            if self.control:
+                return self.control.popleft(), CONTROL
+            timeout = None
+            if self.bulk:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return self.bulk.popitem(last=False)[1], BULK
+                timeout = (1 - self.tokens) / self.rate
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send_to(self, websocket, on_sent=None):
+        """
+        Be the only writer to `websocket` until it closes or the task is cancelled.
+        on_sent(message, priority) is called as each message is written.
+        """
+        while True:
+            message, priority = await self.get()
+            await websocket.send(message)
+            UPSTREAM_SENT.inc(robot=self.robot, priority=priority)
+            if on_sent:
+                on_sent(message, priority)
+
+    def __len__(self):
+        return len(self.control) + len(self.bulk)